@@ -0,0 +1,60 @@
+'''Benchmark the arithmetic fiscal year binning against the pd.cut
+binning it replaced.
+
+Requires the package to be installed, e.g. with pip install -e .
+Usage: python benchmarks/fiscal_year.py [n_dates]
+'''
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from press_dash_lib import utils
+
+
+def get_year_with_cut(date, start_of_year='January 1'):
+    '''The previous implementation of utils.get_year, for comparison.'''
+    years_min = date.min().year - 1
+    date_bins = pd.date_range(
+        '{} {}'.format(start_of_year, years_min),
+        pd.Timestamp.now() + pd.offsets.DateOffset(years=1),
+        freq=pd.offsets.DateOffset(years=1),
+        inclusive="left",
+    )
+    date_bin_labels = date_bins.year[:-1]
+    return pd.cut(date, date_bins, right=False, labels=date_bin_labels).astype('Int64')
+
+
+def main(n_dates: int = 10**6, n_repeats: int = 5):
+
+    rng = np.random.default_rng(42)
+    start = np.datetime64('2000-01-01').astype(np.int64)
+    stop = np.datetime64('2024-12-31').astype(np.int64)
+    dates = pd.Series(
+        rng.integers(start, stop, size=n_dates).astype('datetime64[D]'),
+        name='Date',
+    )
+
+    # Check the two agree before timing them
+    expected = get_year_with_cut(dates, 'September 1')
+    actual = utils.get_year(dates, 'September 1')
+    assert expected.equals(actual), 'The binnings disagree.'
+
+    timings = {
+        'pd.cut, one start month': lambda: get_year_with_cut(dates, 'September 1'),
+        'pd.cut, twelve start months': lambda: [
+            get_year_with_cut(dates, '{} 1'.format(month))
+            for month in pd.date_range('2000-01', periods=12, freq='MS').month_name()
+        ],
+        'get_year, one start month': lambda: utils.get_year(dates, 'September 1'),
+        'get_fiscal_periods, twelve start months': lambda: utils.get_fiscal_periods(dates),
+    }
+    print('{:,} dates, best of {} runs'.format(n_dates, n_repeats))
+    for label, fn in timings.items():
+        best = min(timeit.repeat(fn, number=1, repeat=n_repeats))
+        print('{:>40}: {:8.1f} ms'.format(label, best * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
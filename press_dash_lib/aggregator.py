@@ -9,6 +9,118 @@ import numpy as np
 import pandas as pd
 
 
+def factorize_columns(df: pd.DataFrame, columns: list[str]) -> Tuple[list, list]:
+    '''Convert columns to integer codes, for aggregating with array operations.
+    Rows missing a value in any of the columns are dropped, as pivot_table would.
+
+    Args:
+        df: The dataframe containing the columns.
+        columns: The columns to convert.
+
+    Returns:
+        codes: For each column, the code of each kept row.
+        uniques: For each column, the sorted values the codes refer to.
+        is_valid: True for the rows that were kept.
+    '''
+    codes = []
+    uniques = []
+    for column in columns:
+        codes_i, uniques_i = pd.factorize(df[column], sort=True)
+        codes.append(codes_i.astype(np.int64))
+        uniques.append(uniques_i)
+
+    is_valid = np.logical_and.reduce([codes_i >= 0 for codes_i in codes])
+    if not is_valid.all():
+        codes = [codes_i[is_valid] for codes_i in codes]
+
+    return codes, uniques, is_valid
+
+
+def count_cells(
+    x_codes: np.ndarray,
+    group_codes: np.ndarray,
+    value_codes: np.ndarray,
+    n_x: int,
+    n_groups: int,
+    n_values: int,
+) -> np.ndarray:
+    '''Count the distinct values in each (x, group) cell.
+
+    Args:
+        x_codes: The x code of each row.
+        group_codes: The group code of each row.
+        value_codes: The code of each row's value to count.
+        n_x: The number of x values.
+        n_groups: The number of groups.
+        n_values: The number of distinct values.
+
+    Returns:
+        counts: Array of shape (n_x, n_groups).
+    '''
+    # Sorting the combined codes gives each (x, group, counted value)
+    # once, so counting them per (x, group) counts distinct values
+    cells = x_codes * n_groups + group_codes
+    unique_keys = np.unique(cells * n_values + value_codes)
+    counts = np.bincount(
+        unique_keys // max(n_values, 1),
+        minlength=n_x * n_groups,
+    )
+
+    return counts.reshape(n_x, n_groups)
+
+
+def sum_cells(
+    x_codes: np.ndarray,
+    group_codes: np.ndarray,
+    id_codes: np.ndarray,
+    weights: np.ndarray,
+    n_x: int,
+    n_groups: int,
+    n_ids: int,
+) -> np.ndarray:
+    '''Sum the weights in each (x, group) cell, counting each id once per group.
+
+    Args:
+        x_codes: The x code of each row.
+        group_codes: The group code of each row.
+        id_codes: The id code of each row.
+        weights: The weight of each row. Missing weights count as 0.
+        n_x: The number of x values.
+        n_groups: The number of groups.
+        n_ids: The number of ids.
+
+    Returns:
+        sums: Array of shape (n_x, n_groups).
+    '''
+    # We keep one entry per ID and group. This is to avoid double-counting.
+    # np.unique gives the first row for each pair, so no frame copy
+    # or combined string column is needed.
+    _, first_rows = np.unique(group_codes * n_ids + id_codes, return_index=True)
+    sums = np.bincount(
+        x_codes[first_rows] * n_groups + group_codes[first_rows],
+        weights=np.nan_to_num(weights[first_rows]),
+        minlength=n_x * n_groups,
+    )
+
+    return sums.reshape(n_x, n_groups)
+
+
+def get_weights(df: pd.DataFrame, weight_column: str, is_valid: np.ndarray) -> np.ndarray:
+    '''Get the weights to sum as floats.
+
+    Args:
+        df: The dataframe containing the weights.
+        weight_column: The column to sum.
+        is_valid: True for the rows to keep, from factorize_columns.
+
+    Returns:
+        weights: The weights of the kept rows.
+    '''
+    # Non-numeric weights, e.g. placeholders, count as missing
+    weights = pd.to_numeric(df[weight_column], errors='coerce')
+    return weights.to_numpy(dtype=float, na_value=np.nan)[is_valid]
+
+
 class Aggregator:
     '''Class for summarizing data.
     Deals only with behavior---holds no state information
@@ -44,22 +156,27 @@ class Aggregator:
             totals: The series containing the counts per year
         '''
 
+        columns = [x_column, count_column]
+        if groupby_column is not None:
+            columns.append(groupby_column)
+        codes, uniques, _ = factorize_columns(df, columns)
+        x_codes, count_codes = codes[0], codes[1]
+        group_codes = codes[2] if groupby_column is not None else np.zeros_like(x_codes)
+        n_x = len(uniques[0])
+        n_groups = len(uniques[2]) if groupby_column is not None else 1
+
+        counts = count_cells(x_codes, group_codes, count_codes, n_x, n_groups, len(uniques[1]))
+
+        index = pd.Index(uniques[0], name=x_column)
         if groupby_column is None:
-            totals = df.pivot_table(
-                index=x_column,
-                values=count_column,
-                aggfunc='nunique',
-            )
-            totals.fillna(value=0, inplace=True)
+            totals = pd.DataFrame({count_column: counts[:, 0]}, index=index)
             return totals
         else:
-            counts = df.pivot_table(
-                index=x_column,
-                columns=groupby_column,
-                values=count_column,
-                aggfunc='nunique',
+            counts = pd.DataFrame(
+                counts,
+                index=index,
+                columns=pd.Index(uniques[2], name=groupby_column),
             )
-            counts.fillna(value=0, inplace=True)
             return counts
 
     def sum(
@@ -84,28 +201,161 @@ class Aggregator:
             totals: The series containing the counts per year
         '''
 
-        # We keep one entry per ID and group. This is to avoid double-counting.
-        selected_for_sum_df = df.copy()
-        if groupby_column is None:
-            # For totals we only need one entry per ID.
-            selected_for_sum_df.drop_duplicates(subset='id', keep='first', inplace=True)
-            totals = selected_for_sum_df.pivot_table(
-                values=weight_column,
-                index=x_column,
-                aggfunc='sum'
-            )
-            totals = totals.fillna(0)
+        columns = [x_column, 'id']
+        if groupby_column is not None:
+            columns.append(groupby_column)
+        codes, uniques, is_valid = factorize_columns(df, columns)
+        x_codes, id_codes = codes[0], codes[1]
+        group_codes = codes[2] if groupby_column is not None else np.zeros_like(x_codes)
+        n_x = len(uniques[0])
+        n_groups = len(uniques[2]) if groupby_column is not None else 1
+
+        summed = sum_cells(
+            x_codes,
+            group_codes,
+            id_codes,
+            get_weights(df, weight_column, is_valid),
+            n_x,
+            n_groups,
+            len(uniques[1]),
+        )
+        if pd.api.types.is_integer_dtype(df[weight_column]):
+            summed = summed.astype(np.int64)
 
+        index = pd.Index(uniques[0], name=x_column)
+        if groupby_column is None:
+            totals = pd.DataFrame({weight_column: summed[:, 0]}, index=index)
             return totals
         else:
-            selected_for_sum_df['id_and_group'] = df['id'].astype(str) + df[groupby_column]
-            selected_for_sum_df.drop_duplicates(subset='id_and_group', keep='first', inplace=True)
-            summed = selected_for_sum_df.pivot_table(
-                values=weight_column,
-                index=x_column,
-                columns=groupby_column,
-                aggfunc='sum'
+            summed = pd.DataFrame(
+                summed,
+                index=index,
+                columns=pd.Index(uniques[2], name=groupby_column),
             )
-            summed = summed.fillna(0)
+            return summed
+
+    def aggregate_with_totals(
+        self,
+        df: pd.DataFrame,
+        x_column: str,
+        y_column: str,
+        groupby_column: str,
+        aggregation_method: str = 'count',
+        x_values: list = None,
+        categories: list = None,
+    ) -> Tuple[pd.DataFrame, Union[pd.DataFrame, pd.Series], pd.DataFrame]:
+        '''Aggregate stats per category and in total, factorizing the data once.
+        The totals count each entry once, even when it's in several categories.
+
+        Args:
+            df: The dataframe containing the selected data.
+            x_column: The column containing the year or other time bin value.
+            y_column: What to count up or sum.
+            groupby_column: The category to group the data by, e.g. 'Research Topics'.
+            aggregation_method: How to aggregate, 'count' or 'sum'.
+            x_values: If given, the aggregated data and totals are returned
+                as a dense grid over these x values. See to_grid.
+            categories: Categories to include in the dense grid,
+                in addition to those in the data.
+
+        Returns:
+            aggregated: The dataframe containing the stats per year per category.
+            totals: The dataframe containing the stats per year,
+                or the series of them if x_values is given.
+            total_by_instance: The stats per category across all years,
+                in the column 'Aggregate', sorted from largest to smallest.
+        '''
+        if aggregation_method == 'count':
+            columns = [x_column, y_column, groupby_column]
+        elif aggregation_method == 'sum':
+            columns = [x_column, 'id', groupby_column]
+        else:
+            raise KeyError('Requested aggregation method "{}" is not available.'.format(aggregation_method))
+        codes, uniques, is_valid = factorize_columns(df, columns)
+        x_codes, value_codes, group_codes = codes
+        n_x, n_values, n_groups = [len(uniques_i) for uniques_i in uniques]
+
+        # The totals are a single group
+        no_group_codes = np.zeros_like(x_codes)
+        if aggregation_method == 'count':
+            aggregated = count_cells(x_codes, group_codes, value_codes, n_x, n_groups, n_values)
+            totals = count_cells(x_codes, no_group_codes, value_codes, n_x, 1, n_values)
+        else:
+            weights = get_weights(df, y_column, is_valid)
+            aggregated = sum_cells(x_codes, group_codes, value_codes, weights, n_x, n_groups, n_values)
+            totals = sum_cells(x_codes, no_group_codes, value_codes, weights, n_x, 1, n_values)
+            if pd.api.types.is_integer_dtype(df[y_column]):
+                aggregated = aggregated.astype(np.int64)
+                totals = totals.astype(np.int64)
+
+        index = pd.Index(uniques[0], name=x_column)
+        aggregated = pd.DataFrame(
+            aggregated,
+            index=index,
+            columns=pd.Index(uniques[2], name=groupby_column),
+        )
+        totals = pd.DataFrame({y_column: totals[:, 0]}, index=index)
+
+        # Summed over the grid, so categories without data are included
+        if x_values is not None:
+            aggregated, totals = self.to_grid(aggregated, totals, x_values, categories)
+        total_by_instance = self.get_total_by_instance(aggregated)
+
+        return aggregated, totals, total_by_instance
+
+    def get_total_by_instance(self, aggregated: pd.DataFrame) -> pd.DataFrame:
+        '''Get the stats per category across all x values.
+
+        Args:
+            aggregated: The stats per x value per category.
+
+        Returns:
+            total_by_instance: The stats per category, in the column 'Aggregate',
+                sorted from largest to smallest. Ties keep the order of the categories.
+        '''
+        total_by_instance = pd.DataFrame(
+            {'Aggregate': aggregated.to_numpy().sum(axis=0)},
+            index=aggregated.columns,
+        )
+        total_by_instance.sort_values(ascending=False, by='Aggregate', kind='stable', inplace=True)
+
+        return total_by_instance
+
+    def to_grid(
+        self,
+        aggregated: pd.DataFrame,
+        totals: pd.DataFrame,
+        x_values: list,
+        categories: list = None,
+    ) -> Tuple[pd.DataFrame, pd.Series]:
+        '''Convert aggregated data to a dense grid for plotting, with a row for
+        every requested x value and zeros where there's no data.
+
+        Args:
+            aggregated: The stats per x value per category.
+            totals: The stats per x value, in a single column.
+            x_values: The x values to include, in order, e.g. years or month names.
+                Values not in the data get zeros, and data for other values is dropped.
+            categories: Categories to include in addition to those in
+                aggregated, e.g. selected categories that have no data.
+                If given, the categories are sorted.
+
+        Returns:
+            grid: The stats per x value per category. The index holds
+                the x values as strings.
+            totals: The series of stats per x value.
+        '''
+        # Sorted, so the order doesn't depend on which categories have data
+        columns = list(aggregated.columns)
+        if categories is not None:
+            columns = sorted(set(columns).union(categories))
+
+        grid = aggregated.reindex(index=x_values, columns=columns, fill_value=0)
+        grid.index = grid.index.astype(str)
+        grid.index.name = None
+        grid.columns.name = None
+        totals = totals.iloc[:, 0].reindex(x_values, fill_value=0)
+        totals.name = None
+        totals.index.name = None
 
-            return summed
\ No newline at end of file
+        return grid, totals
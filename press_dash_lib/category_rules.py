@@ -0,0 +1,205 @@
+'''Module for the rules in the config that define new categories,
+e.g. "'Northwestern Press' & (not 'External Press')".
+
+A rule is parsed once into a tree, which is then compiled to array
+operations over a boolean matrix of which tags each entry has.
+The operators follow Python's precedence: & binds tighter than |,
+and not (and only) applies to everything after it.
+Preceding a rule with only restricts it to entries with no tags
+other than those named in the rule.
+'''
+import re
+
+import numpy as np
+
+# Quoted tags, operators, parentheses, and keywords
+TOKEN_PATTERN = re.compile(r'''\s*(?:'([^']*)'|"([^"]*)"|(&|\||\(|\))|(not|only)\b)''')
+
+# A new category can use a different source column by naming it in brackets,
+# e.g. "GW vs everything else [Research Topics]"
+SOURCE_COLUMN_PATTERN = re.compile(r'(.*?)\s\[(.+)\]')
+
+
+def tokenize(rule: str) -> list[tuple[str, str]]:
+    '''Split a rule into tokens.
+
+    Args:
+        rule: The rule, e.g. "'Science' & (not 'Outreach')".
+
+    Returns:
+        tokens: (kind, value) pairs, where kind is 'tag', 'op', or 'keyword'.
+    '''
+    tokens = []
+    position = 0
+    rule = rule.rstrip()
+    while position < len(rule):
+        match = TOKEN_PATTERN.match(rule, position)
+        if match is None:
+            raise ValueError(
+                'Could not parse category rule "{}" at position {}.'.format(rule, position)
+            )
+        single_quoted, double_quoted, op, keyword = match.groups()
+        if op is not None:
+            tokens.append(('op', op))
+        elif keyword is not None:
+            tokens.append(('keyword', keyword))
+        else:
+            tokens.append(('tag', single_quoted if single_quoted is not None else double_quoted))
+        position = match.end()
+
+    return tokens
+
+
+def parse_rule(rule: str) -> tuple:
+    '''Parse a rule into a tree.
+
+    Args:
+        rule: The rule, e.g. "only ('Achievement' | 'Event')".
+
+    Returns:
+        tree: Nested tuples, each one of ('tag', name), ('not', tree),
+            ('only', tree), ('and', [trees]), or ('or', [trees]).
+    '''
+    tokens = tokenize(rule)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else (None, None)
+
+    def expect(token):
+        nonlocal position
+        if peek() != token:
+            raise ValueError('Expected "{}" in category rule "{}".'.format(token[1], rule))
+        position += 1
+
+    def parse_expression():
+        nonlocal position
+        kind, value = peek()
+        if kind == 'keyword':
+            position += 1
+            return (value, parse_expression())
+        return parse_binary('|', 'or', parse_and)
+
+    def parse_and():
+        return parse_binary('&', 'and', parse_atom)
+
+    def parse_binary(op, name, parse_operand):
+        nonlocal position
+        operands = [parse_operand()]
+        while peek() == ('op', op):
+            position += 1
+            operands.append(parse_operand())
+        return operands[0] if len(operands) == 1 else (name, operands)
+
+    def parse_atom():
+        nonlocal position
+        kind, value = peek()
+        if kind == 'tag':
+            position += 1
+            return ('tag', value)
+        if (kind, value) == ('op', '('):
+            position += 1
+            tree = parse_expression()
+            expect(('op', ')'))
+            return tree
+        raise ValueError('Expected a quoted tag or "(" in category rule "{}".'.format(rule))
+
+    tree = parse_expression()
+    if position != len(tokens):
+        raise ValueError('Unexpected "{}" in category rule "{}".'.format(peek()[1], rule))
+
+    return tree
+
+
+def get_rule_tags(tree: tuple) -> set:
+    '''Get the tags named in a rule.
+
+    Args:
+        tree: The parsed rule.
+
+    Returns:
+        tags: The tags.
+    '''
+    kind, value = tree
+    if kind == 'tag':
+        return {value,}
+    if kind in ('and', 'or'):
+        return set().union(*[get_rule_tags(operand) for operand in value])
+    return get_rule_tags(value)
+
+
+def compile_rule(tree: tuple, tags: list):
+    '''Compile a parsed rule into a function of the tag membership matrix.
+    Tags that aren't in the data are never present.
+
+    Args:
+        tree: The parsed rule.
+        tags: The tags, in the order of the membership matrix columns.
+
+    Returns:
+        evaluate: Function that accepts a boolean array of shape (n, len(tags))
+            and returns a boolean array of length n, True where the rule holds.
+    '''
+    tag_inds = {tag: i for i, tag in enumerate(tags)}
+    kind, value = tree
+
+    if kind == 'tag':
+        if value not in tag_inds:
+            return lambda has_tag: np.zeros(len(has_tag), dtype=bool)
+        ind = tag_inds[value]
+        return lambda has_tag: has_tag[:, ind]
+    if kind == 'not':
+        evaluate = compile_rule(value, tags)
+        return lambda has_tag: ~evaluate(has_tag)
+    if kind == 'only':
+        evaluate = compile_rule(value, tags)
+        other_inds = [i for tag, i in tag_inds.items() if tag not in get_rule_tags(value)]
+        return lambda has_tag: evaluate(has_tag) & ~has_tag[:, other_inds].any(axis=1)
+    if kind in ('and', 'or'):
+        evaluates = [compile_rule(operand, tags) for operand in value]
+        reduce = np.logical_and.reduce if kind == 'and' else np.logical_or.reduce
+        return lambda has_tag: reduce([evaluate(has_tag) for evaluate in evaluates])
+
+    raise ValueError('Unknown category rule node "{}".'.format(kind))
+
+
+def get_source_column(grouping: str) -> tuple[str, str]:
+    '''Get the name of a new categorization and the column it's built from.
+
+    Args:
+        grouping: The key in new_categories, e.g. 'Press Types'
+            or 'GW vs everything else [Research Topics]'.
+
+    Returns:
+        new_column: The name of the new column.
+        source_column: The column the new categories are built from.
+    '''
+    search = SOURCE_COLUMN_PATTERN.findall(grouping)
+    if len(search) == 0:
+        return grouping, grouping
+    elif len(search) == 1:
+        return search[0]
+    else:
+        raise KeyError('New categories cannot have multiple sets of brackets.')
+
+
+def get_rules_key(source_column: str, rules: dict, combine_single_categories: bool = False) -> list:
+    '''Get a normalized description of how a grouping is recategorized,
+    e.g. for hashing. Rules that differ only in spacing, quotes,
+    or redundant parentheses have the same description.
+
+    Args:
+        source_column: The column the new categories are built from.
+        rules: The new categories, keyed by name, with rules as values.
+        combine_single_categories: Whether undefined singly-tagged entries
+            are grouped into "Other".
+
+    Returns:
+        rules_key: JSON-serializable description. Rules are kept in order,
+            since later rules take precedence.
+    '''
+    return [
+        source_column,
+        [[name, parse_rule(rule)] for name, rule in rules.items()],
+        combine_single_categories,
+    ]
@@ -1,21 +1,42 @@
 '''Main dashboard class.
 '''
+import calendar
+import copy
 import importlib
 import os
+import sys
 import types
-from typing import Union
+from typing import Tuple, Union
 import yaml
 
 import pandas as pd
 import streamlit as st
 
 from . import user_utils as default_user_utils
-from . import settings, interface, data_handler, aggregator, data_viewer
+from . import settings, interface, category_rules, data_handler, aggregator, data_viewer, dataset, indexes, result_cache, store, utils, watcher
 
 # We need to reload all the individual pieces if we want changes in them to propagate
-for module in [settings, interface, data_handler, aggregator, data_viewer]:
+for module in [category_rules, indexes, settings, interface, data_handler, aggregator, data_viewer, store, dataset, result_cache, watcher]:
     importlib.reload(module)
 
+# Datasets are hashed by their version token instead of their data,
+# so looking up cached results doesn't depend on the size of the data
+DATASET_HASH_FUNCS = {dataset.Dataset: lambda handle: handle.version}
+
+# How many recategorized datasets to share across sessions
+N_SHARED_DATASETS = 32
+
+# The library code the prepared data depends on, and the code the shared data
+# additionally depends on, e.g. the index classes it pickles.
+# Stored data made by other versions of the code, e.g. before a deploy, isn't loaded
+PREP_MODULES = [data_handler, utils, store]
+SHARED_MODULES = [indexes, category_rules]
+
+# Identifies the code that computes the aggregations stored on disk, including
+# the filtering and windowing of their input in this module and the fiscal periods,
+# so results computed by other versions of it aren't loaded
+RESULT_VERSION = store.hash_code([aggregator, data_handler, indexes, utils, sys.modules[__name__]])
+
 class DashBuilder:
     '''Main class for constructing dashboards.
 
@@ -38,8 +59,12 @@ class DashBuilder:
         self.settings = settings.Settings(self.config)
         self.interface = interface.Interface(self.config, self.settings)
         self.data_handler = data_handler.DataHandler(self.config, user_utils)
+        self.data_store = store.DataStore(self.config)
         self.agg = aggregator.Aggregator(self.config)
         self.data_viewer = data_viewer.DataViewer(self.config, self.settings)
+        self.result_cache = self.get_result_cache(
+            int(self.config.get('result_cache_mb', 256) * 2**20)
+        )
 
     def load_config(self, config_fp: str) -> dict:
         '''Get the config. This is done once per session.
@@ -64,8 +89,8 @@ class DashBuilder:
             config = yaml.load(file, Loader=yaml.FullLoader)
         return config
 
-    @st.cache_data
-    def prep_data(_self, config: dict) -> pd.DataFrame:
+    @st.cache_resource
+    def prep_data(_self, config: dict) -> Tuple[dict, dict]:
         '''Load, clean, and preprocess the data.
 
         *Note*: calculations cannot depend on any values updated during
@@ -80,11 +105,19 @@ class DashBuilder:
         "self" must be replaced be preceeded by "_" to avoid streamlit
         trying to cache self.
 
+        The prepared data is also cached on disk, keyed by the source files,
+        the user_utils code, and the config, so restarting the dashboard
+        doesn't require rerunning the pipeline.
+
+        The data is cached as a resource, so one copy is shared by every
+        session instead of each getting its own unpickled copy.
+        Use get_data for views of it that can be worked with.
+
         Args:
             config: The config dict.
 
         Returns:
-            preprocessed_df: The preprocessed data.
+            data: Dict containing the prepared data. Shared, so it must not be modified.
             config: The config file. This will also be stored at self.config
         
         Side Effects:
@@ -94,32 +127,157 @@ class DashBuilder:
         msg = 'Prepping data...'
         print(msg)
         with st.spinner(msg):
+            return _self.build_data(config)
+
+    def build_data(self, config: dict) -> Tuple[dict, dict]:
+        '''Uncached version of prep_data, usable outside of streamlit,
+        e.g. by the raw data watcher.
+
+        Args:
+            config: The config dict.
+
+        Returns:
+            data: Dict containing the preprocessed data,
+                the raw and cleaned data unless it was streamed,
+                the indexes used for filtering, and a dataset handle
+                for the preprocessed data and its indexes,
+                versioned by the key of the shared data.
+            config: The config file, possibly updated by the user_utils.
+        '''
+        key = self.data_store.get_key(
+            self.data_handler.get_source_fps(config),
+            config,
+            code_version=store.hash_code(PREP_MODULES),
+        )
+        shared_key = store.hash_object([key, store.hash_code(SHARED_MODULES)])
+
+        # When another process has already prepared this version, the data and
+        # indexes are memory-mapped from disk, and there's nothing to compute
+        data, shared_config = self.data_store.load_shared(shared_key)
+        if data is not None:
+            # The raw and cleaned data aren't shared, since only the data viewer
+            # uses them, so they're loaded from the prepped version if it's kept
+            prepped_data, _ = self.data_store.load_prepped(key, data_keys=['raw', 'cleaned'])
+            if prepped_data is not None:
+                data = {**prepped_data, **data}
+            data = reapply_schema(data, shared_config)
+            data['dataset'] = dataset.Dataset(data['preprocessed'], shared_key, data['indexes'])
+            return data, shared_config
+
+        data, prepped_config = self.data_store.load_prepped(key)
+
+        # For large data we process it a chunk at a time,
+        # writing straight to disk and keeping only the final result
+        chunksize = config.get('stream_chunksize')
+        if data is None and chunksize is not None:
+            self.data_store.save_prepped_chunks(
+                key,
+                'preprocessed',
+                self.data_handler.stream_data(config, chunksize),
+            )
+            data, prepped_config = self.data_store.load_prepped(key, force=True)
+
+        if data is not None:
+            data = reapply_schema(data, prepped_config)
+            config = prepped_config
+        else:
             data = {}
-            data['raw'], config = _self.data_handler.load_data(config)
-            data['cleaned'], config = _self.data_handler.clean_data(data['raw'], config)
-            data['preprocessed'], config = _self.data_handler.preprocess_data(data['cleaned'], config)
+            data['raw'], config = self.data_handler.load_data(config)
+            data['cleaned'], config = self.data_handler.clean_data(data['raw'], config)
+            data['preprocessed'], config = self.data_handler.preprocess_data(data['cleaned'], config)
+            self.data_store.save_prepped(key, data, config)
 
-            return data, config
+        # Cheap compared to prepping, so they're built after loading the prepped data,
+        # and stored only with the shared version
+        data['indexes'] = self.data_handler.build_indexes(data['preprocessed'], config)
+        self.data_store.save_shared(shared_key, data['preprocessed'], data['indexes'], config)
 
-    '''
-    @st.cache_data
+        # The shared key identifies the prepared data and its indexes,
+        # for caching anything derived from them
+        data['dataset'] = dataset.Dataset(data['preprocessed'], shared_key, data['indexes'])
+
+        return data, config
+
+    @st.cache_resource
+    def start_watcher(_self, watch_dir: str, interval: float) -> watcher.RawDataWatcher:
+        '''Start watching the raw data, rebuilding the data when it changes.
+        Cached as a resource, so there is one watcher per server process,
+        shared by all sessions.
+
+        Args:
+            watch_dir: The directory containing the raw data.
+            interval: Seconds between checks of the directory.
+
+        Returns:
+            raw_data_watcher: The running watcher.
+        '''
+        config = copy.deepcopy(_self.config)
+        raw_data_watcher = watcher.RawDataWatcher(
+            watch_dir,
+            lambda: _self.build_data(copy.deepcopy(config)),
+            interval=interval,
+        )
+        msg = 'Prepping data...'
+        print(msg)
+        with st.spinner(msg):
+            raw_data_watcher.start()
+
+        return raw_data_watcher
+
+    def get_data(self) -> Tuple[dict, dict]:
+        '''Get the prepared data for this run of the dashboard.
+        If watch_raw_data is set in the config, the data comes from
+        the raw data watcher, and changes to the raw data show up
+        once they're rebuilt. Otherwise this is prep_data.
+
+        Returns:
+            data: Dict containing the prepared data.
+                This is a new dict each call, so it can be added to freely.
+                The dataframes are views of data shared across sessions,
+                so they aren't copied, and changes to them aren't shared.
+            config: The config file, possibly updated by the user_utils.
+        '''
+        if not self.config.get('watch_raw_data', False):
+            data, config = self.prep_data(self.config)
+        else:
+            raw_data_watcher = self.start_watcher(
+                os.path.join(self.config['data_dir'], self.config['input_dirname']),
+                self.config.get('watch_interval', 10.),
+            )
+            version, (data, config) = raw_data_watcher.current()
+
+        data_views = {}
+        for key, value in data.items():
+            if isinstance(value, pd.DataFrame):
+                value = dataset.view(value)
+            elif isinstance(value, dataset.Dataset):
+                value = value.view()
+            data_views[key] = value
+
+        return data_views, copy.deepcopy(config)
+
+    @st.cache_resource(hash_funcs=DATASET_HASH_FUNCS, max_entries=N_SHARED_DATASETS)
     def recategorize_data(
             _self,
-            preprocessed_df: pd.DataFrame,
+            preprocessed: dataset.Dataset,
             new_categories: dict = None,
             recategorize: bool = True,
             combine_single_categories: bool = False,
-        ) -> pd.DataFrame:
-        Recategorize the data, i.e. combine existing categories into new ones.
+        ) -> dataset.Dataset:
+        '''Recategorize the data, i.e. combine existing categories into new ones.
         The end result is one category per article, so no articles are double-counted.
         However, if the new categories are ill-defined they can contradict one another
         and lead to inconsistencies.
 
         This is a wrapper for the same function in the data handler.
         Part of the motivation for being a wrapper is to limit data caching to the builder.
+        The recategorized columns are also stored on disk, keyed by the version
+        of the data and the rules for each grouping, so they're reused across restarts
+        and when the rules for other groupings change.
+        The result is shared by every session, so it must not be modified.
 
         Args:
-            preprocessed_df: The dataframe containing the original data.
+            preprocessed: The original data and its indexes.
             new_categories: The new categories to use.
             recategorize: Whether to recategorize the data. Included for caching.
             combine_single_categories: If True, instead of leaving
@@ -127,58 +285,118 @@ class DashBuilder:
                 group them all into an "Other" category.
 
         Returns:
-            recategorized: The dataframe containing the recategorized data.
-                One entry per article.
-        
+            recategorized: The recategorized data, one entry per article,
+                in the same order as the original data. The indexes that depend
+                on the categories are rebuilt, and the others are shared,
+                since the rows are unchanged.
+        '''
+        if new_categories is None:
+            new_categories = _self.config.get('new_categories', {})
+
+        load_fn = lambda rules_key, compute_fn: _self.data_store.load_column(
+            preprocessed.version,
+            store.hash_object(rules_key),
+            compute_fn,
+        )
+
         msg = 'Recategorizing data...'
         print(msg)
         with st.spinner(msg):
-            return _self.data_handler.recategorize_data(
-                preprocessed_df=preprocessed_df,
+            recategorized_df = _self.data_handler.recategorize_data(
+                preprocessed_df=preprocessed.df,
                 new_categories=new_categories,
                 recategorize=recategorize,
                 combine_single_categories=combine_single_categories,
+                load_fn=load_fn,
             )
-    '''
+            groupings = list(_self.config['groupings'])
+            if recategorize:
+                for grouping in new_categories:
+                    new_column, _ = category_rules.get_source_column(grouping)
+                    if new_column not in groupings:
+                        groupings.append(new_column)
+            recategorized_indexes = _self.data_handler.build_grouping_indexes(
+                recategorized_df,
+                groupings,
+                _self.config,
+            )
+            return preprocessed.derive(
+                recategorized_df,
+                'recategorize',
+                indexes={**preprocessed.indexes, **recategorized_indexes},
+                new_categories=new_categories,
+                recategorize=recategorize,
+                combine_single_categories=combine_single_categories,
+            )
+
+    @st.cache_resource
+    def get_result_cache(_self, max_bytes: int) -> result_cache.ResultCache:
+        '''Get the cache for filtered and aggregated results. Cached as a resource,
+        so there is one per server process, shared by all sessions.
+
+        Args:
+            max_bytes: The memory budget of the cache.
+
+        Returns:
+            results: The cache.
+        '''
+        return result_cache.ResultCache(max_bytes)
 
-    @st.cache_data
     def filter_data(
-        _self,
-        preprocessed_df: pd.DataFrame,
+        self,
+        preprocessed: dataset.Dataset,
         filters: dict,
-    ) -> pd.DataFrame:
+        explode_column: str = None,
+    ) -> dataset.Dataset:
         '''Filter what data shows up in the dashboard.
+        The result is shared by every session, so it must not be modified.
 
         Args:
-            recategorized_df: The dataframe containing the data.
-            text_filters (dict): Search fields for text.
-            categorical_filters (dict): How categories are filtered.
-            numerical_filters (dict): Ranges for numerical data filters
+            preprocessed: The data, one row per entry, and its indexes.
+            filters: The filters, e.g. filters['categorical'] for how categories are filtered.
+            explode_column: If given, the selected data gets one row per
+                selected tag in this column.
 
         Returns:
-            selected_df: The dataframe containing the selected data.
+            selected: The selected data.
         '''
-        msg = 'Filtering data...'
-        print(msg)
-        with st.spinner(msg):
-            return _self.data_handler.filter_data(
-                preprocessed_df=preprocessed_df,
-                filters=filters,
-            )
+        # Filters that select the same data share the result
+        filters = dataset.normalize_filters(filters)
+
+        def compute_fn():
+            msg = 'Filtering data...'
+            print(msg)
+            with st.spinner(msg):
+                selected_df = self.data_handler.filter_data(
+                    preprocessed_df=preprocessed.df,
+                    filters=filters,
+                    data_indexes=preprocessed.indexes,
+                    explode_column=explode_column,
+                )
+                return preprocessed.derive(
+                    selected_df,
+                    'filter',
+                    filters=filters,
+                    explode_column=explode_column,
+                )
+
+        key = store.hash_object(['filter', preprocessed.version, [filters, explode_column]])
+        return self.result_cache.get_or_compute(key, compute_fn)
 
-    @st.cache_data
     def aggregate(
-        _self,
-        df: pd.DataFrame,
+        self,
+        selected: dataset.Dataset,
         x_column: str,
         y_column: str,
         groupby_column: str = None,
         aggregation_method: str = 'count',
     ) -> Union[pd.Series, pd.DataFrame]:
         '''Aggregate stats.
+        The result is shared by every session, so it must not be modified.
+        If persist_results is set, it's also stored on disk for other processes.
         
         Args:
-            df: The dataframe containing the selected data.
+            selected: The selected data.
             x_column: The column containing the year or other time bin value.
             weight_column: What to count up.
             groupby_column: The category to group the data by, e.g. 'Research Topics'.
@@ -190,24 +408,301 @@ class DashBuilder:
                 or
             totals: The series containing the counts per year
         '''
-        
+        def compute_fn():
+            msg = 'Aggregating...'
+            print(msg)
+            with st.spinner(msg):
+                if aggregation_method == 'count':
+                    return self.agg.count(
+                        df=selected.df,
+                        x_column=x_column,
+                        count_column=y_column,
+                        groupby_column=groupby_column,
+                    )
+                elif aggregation_method == 'sum':
+                    return self.agg.sum(
+                        df=selected.df,
+                        x_column=x_column,
+                        weight_column=y_column,
+                        groupby_column=groupby_column,
+                    )
+                else:
+                    raise KeyError('Requested aggregation method "{}" is not available.'.format(aggregation_method))
 
-        msg = 'Aggregating...'
-        print(msg)
-        with st.spinner(msg):
-            if aggregation_method == 'count':
-                return _self.agg.count(
-                    df=df,
-                    x_column=x_column,
-                    count_column=y_column,
-                    groupby_column=groupby_column,
-                )
-            elif aggregation_method == 'sum':
-                return _self.agg.sum(
-                    df=df,
+        key = store.hash_object([
+            'aggregate',
+            selected.version,
+            RESULT_VERSION,
+            [x_column, y_column, groupby_column, aggregation_method],
+        ])
+        return self.result_cache.get_or_compute(
+            key,
+            lambda: self.data_store.load_result(key, compute_fn),
+        )
+
+    def aggregate_with_totals(
+        self,
+        selected: dataset.Dataset,
+        x_column: str,
+        y_column: str,
+        groupby_column: str,
+        aggregation_method: str = 'count',
+        x_values: list = None,
+        categories: list = None,
+    ) -> Tuple[pd.DataFrame, Union[pd.DataFrame, pd.Series], pd.DataFrame]:
+        '''Aggregate stats per category and in total with one pass over the data,
+        instead of calling aggregate once for each.
+        The results are shared by every session, so they must not be modified.
+        If persist_results is set, they're also stored on disk for other processes.
+
+        Args:
+            selected: The selected data.
+            x_column: The column containing the year or other time bin value.
+            y_column: What to count up or sum.
+            groupby_column: The category to group the data by, e.g. 'Research Topics'.
+            aggregation_method: How to aggregate.
+            x_values: If given, the results are a dense grid over these x values.
+            categories: Categories to include in the dense grid,
+                in addition to those in the data.
+
+        Returns:
+            aggregated: The dataframe containing the stats per year per category.
+            totals: The stats per year, counting each entry once.
+            total_by_instance: The stats per category across all years.
+        '''
+        # Categories without data are added to the grid in sorted order,
+        # so the order they were selected in doesn't matter
+        if categories is not None:
+            categories = sorted(set(categories))
+
+        def compute_fn():
+            msg = 'Aggregating...'
+            print(msg)
+            with st.spinner(msg):
+                return self.agg.aggregate_with_totals(
+                    df=selected.df,
                     x_column=x_column,
-                    weight_column=y_column,
+                    y_column=y_column,
                     groupby_column=groupby_column,
+                    aggregation_method=aggregation_method,
+                    x_values=x_values,
+                    categories=categories,
                 )
-            else:
-                raise KeyError('Requested aggregation method "{}" is not available.'.format(aggregation_method))
\ No newline at end of file
+
+        key = store.hash_object([
+            'aggregate_with_totals',
+            selected.version,
+            RESULT_VERSION,
+            [x_column, y_column, groupby_column, aggregation_method, x_values, categories],
+        ])
+        return self.result_cache.get_or_compute(
+            key,
+            lambda: self.data_store.load_result(key, compute_fn),
+        )
+
+    def window_data(
+        self,
+        source: dataset.Dataset,
+        groupby_column: str,
+        filters: dict,
+        month_start: int,
+        year_start: int,
+        year_end: int,
+    ) -> Tuple[dataset.Dataset, dataset.Dataset]:
+        '''Select the entries of a view and window them to its fiscal years.
+        The results are shared by every session, so they must not be modified.
+
+        Args:
+            source: The data, one row per entry, and its indexes.
+            groupby_column: The category to group the data by, e.g. 'Research Topics'.
+            filters: The filters, e.g. filters['categorical'] for how categories are filtered.
+            month_start: The month the twelve-month period starts on.
+            year_start: The first fiscal year shown.
+            year_end: The last fiscal year shown. If the same as year_start,
+                the data is binned per month instead of per year.
+
+        Returns:
+            selected: The selected data, one row per selected group of each entry.
+            windowed: The selected data within the fiscal years, with the time bins.
+        '''
+        by_month = year_end <= year_start
+
+        # Apply data filters, then give each selected entry one row per selected group
+        selected = self.filter_data(source, filters, explode_column=groupby_column)
+
+        # The fiscal periods for every start month are computed when the data is prepared,
+        # so windowing is a range selection on integer arrays.
+        # The prepared data has a unique index, so it locates the selected rows
+        # The selected data is shared with other sessions, so columns are added to new frames
+        fiscal_years, fiscal_months = source.indexes['fiscal'].get(
+            month_start,
+            source.df.index.get_indexer(selected.df.index),
+        )
+        is_windowed = (fiscal_years >= year_start) & (fiscal_years <= year_end)
+        windowed_df = selected.df.loc[is_windowed].assign(**{'Reindexed Year': fiscal_years[is_windowed]})
+        if by_month:
+            windowed_df = windowed_df.assign(**{
+                'Reindexed Month': fiscal_months[is_windowed],
+                'Calendar Month': windowed_df['Date'].dt.month.map(dict(enumerate(calendar.month_name))),
+            })
+
+        # The windowed data is identified by the selection and the window,
+        # so the aggregation is looked up without hashing the data
+        windowed = selected.derive(
+            windowed_df,
+            'window',
+            month_start=month_start,
+            year_start=year_start,
+            year_end=year_end,
+            by_month=by_month,
+        )
+
+        return selected, windowed
+
+    def aggregate_view(
+        self,
+        source: dataset.Dataset,
+        groupby_column: str,
+        y_column: str,
+        aggregation_method: str,
+        filters: dict,
+        month_start: int,
+        year_start: int,
+        year_end: int,
+    ) -> dict:
+        '''Get the data for a view of the dashboard: the stats per time bin
+        per category, and in total. Views without filters the data cube can't apply
+        are answered from the cube, and the rest by filtering, windowing,
+        and aggregating the entries. Used by the dashboard pages, and to pre-warm the caches.
+
+        Count views are only answered from the cube if the counted column is
+        a unique id, e.g. the article id (see indexes.DataCube). Counts of other
+        columns, e.g. Title, which isn't unique in the shipped data,
+        always filter and aggregate the entries.
+
+        Args:
+            source: The data, one row per entry, and its indexes.
+            groupby_column: The category to group the data by, e.g. 'Research Topics'.
+            y_column: What to count up or sum.
+            aggregation_method: How to aggregate, 'count' or 'sum'.
+            filters: The filters, e.g. filters['categorical'] for how categories are filtered.
+            month_start: The month the twelve-month period starts on.
+            year_start: The first fiscal year shown.
+            year_end: The last fiscal year shown. If the same as year_start,
+                the stats are per month instead of per year.
+
+        Returns:
+            view_data: Dict with the aggregated data, the totals, and the total by instance,
+                as a dense grid over every x value and selected category,
+                and the selected, windowed, and final processed data.
+                If the view was answered from the cube, the latter are functions
+                that compute the data when called, e.g. when shown by DataViewer.write.
+        '''
+        by_month = year_end <= year_start
+        if by_month:
+            months = [(month - 1) % 12 + 1 for month in range(month_start, month_start + 12)]
+            x_values = [calendar.month_name[month] for month in months]
+        else:
+            x_values = list(range(year_start, year_end + 1))
+        # Without a filter on the grouping every category is selected, so the grid
+        # has a column for each, whether or not the view is answered from the cube
+        bitmap_index = source.indexes.get('bitmaps')
+        if groupby_column in filters.get('categorical', {}):
+            selected_categories = sorted(set(filters['categorical'][groupby_column]))
+        elif bitmap_index is not None and groupby_column in bitmap_index.columns:
+            selected_categories = sorted(bitmap_index.tags[groupby_column])
+        else:
+            selected_categories = []
+
+        window_args = (source, groupby_column, filters, month_start, year_start, year_end)
+        view_data = {}
+
+        # Most views can be answered from the data cube built when the data was prepared,
+        # without filtering or aggregating the entries
+        data_cube = source.indexes['cube']
+        if data_cube.can_aggregate(groupby_column, y_column, aggregation_method, filters):
+            # The entries are only filtered and windowed if they're viewed
+            view_data['selected'] = lambda: self.window_data(*window_args)[0].df
+            view_data['windowed'] = lambda: self.window_data(*window_args)[1].df
+            view_data['final processed'] = lambda: get_final_processed(
+                source.df,
+                self.window_data(*window_args)[1].df,
+            )
+
+            view_data['aggregated'], view_data['totals'], _ = data_cube.aggregate(
+                groupby_column,
+                y_column,
+                aggregation_method,
+                selected_tags=filters.get('categorical', {}).get(groupby_column),
+                start_month=month_start,
+                year_start=year_start,
+                year_end=year_end,
+                by_month=by_month,
+            )
+            view_data['aggregated'], view_data['totals'] = self.agg.to_grid(
+                view_data['aggregated'],
+                view_data['totals'],
+                x_values,
+                selected_categories,
+            )
+            # Summed over the grid, as when the entries are aggregated
+            view_data['total by instance'] = self.agg.get_total_by_instance(view_data['aggregated'])
+
+            return view_data
+
+        selected, windowed = self.window_data(*window_args)
+        view_data['selected'] = selected.df
+        view_data['windowed'] = windowed.df
+        view_data['final processed'] = get_final_processed(source.df, windowed.df)
+
+        view_data['aggregated'], view_data['totals'], view_data['total by instance'] = self.aggregate_with_totals(
+            windowed,
+            'Calendar Month' if by_month else 'Reindexed Year',
+            y_column,
+            groupby_column,
+            aggregation_method,
+            x_values=x_values,
+            categories=selected_categories,
+        )
+
+        return view_data
+
+
+def get_final_processed(source_df: pd.DataFrame, windowed_df: pd.DataFrame) -> pd.DataFrame:
+    '''Get a human-readable datasheet with one row per entry in the windowed data.
+
+    Args:
+        source_df: The data, one row per entry.
+        windowed_df: The windowed data, possibly with several rows per entry.
+
+    Returns:
+        final_processed: The rows of source_df for the windowed entries.
+    '''
+    return source_df.filter(items=set(windowed_df.index), axis=0)
+
+
+def reapply_schema(data: dict, config: dict) -> dict:
+    '''Reapply the column types to data loaded from disk.
+    Some details of the column types aren't kept on disk, e.g. text columns
+    are loaded as python strings instead of Arrow strings, and streamed data
+    is stored at full integer width.
+
+    Args:
+        data: Dict containing the preprocessed data, and the raw and cleaned data if loaded.
+        config: The config the data was prepped with.
+
+    Returns:
+        data: The data, with the column types of freshly-prepped data.
+    '''
+    data['preprocessed'] = utils.apply_schema(data['preprocessed'], config)
+
+    # The raw and cleaned data only have the dtypes they're read with
+    for data_key in ['raw', 'cleaned']:
+        if data_key in data:
+            data[data_key] = utils.apply_schema(
+                data[data_key],
+                config,
+                utils.get_parse_dtypes(config),
+            )
+
+    return data
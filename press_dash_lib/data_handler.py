@@ -1,6 +1,10 @@
 '''Module for handling data: Loading, transforming, extracting, etc.
 '''
 import copy
+import functools
+import glob
+import inspect
+import os
 import re
 import types
 from typing import Tuple
@@ -8,6 +12,8 @@ from typing import Tuple
 import numpy as np
 import pandas as pd
 
+from . import category_rules, indexes, utils
+
 
 class DataHandler:
     '''Class for handling data.
@@ -21,6 +27,30 @@ class DataHandler:
         self.config = config
         self.user_utils = user_utils
 
+    def get_source_fps(self, config: dict) -> list[str]:
+        '''Get the filepaths of the files the prepared data depends on,
+        i.e. the data files loaded and the user_utils code run on them.
+        If user_utils doesn't say which data files it loads,
+        then everything in the input directory is assumed to be used.
+
+        Args:
+            config: The config dict.
+
+        Returns:
+            source_fps: The filepaths.
+        '''
+        if hasattr(self.user_utils, 'get_source_fps'):
+            # Each data source can be one file or a list of files
+            source_fps = []
+            for fps in self.user_utils.get_source_fps(config).values():
+                source_fps += [fps,] if isinstance(fps, str) else list(fps)
+        else:
+            input_dir = os.path.join(config['data_dir'], config['input_dirname'])
+            source_fps = sorted(glob.glob(os.path.join(input_dir, '*')))
+        source_fps.append(inspect.getsourcefile(self.user_utils))
+
+        return source_fps
+
     def load_data(self, config: dict) -> Tuple[pd.DataFrame, dict]:
         '''Load the data using the stored config and user_utils.
 
@@ -34,7 +64,31 @@ class DataHandler:
         '''
         raw_df, config = self.user_utils.load_data(config)
 
-        return raw_df, config
+        # Converted as when stored, so the data is the same when loaded from disk
+        return utils.stringify_mixed_columns(raw_df), config
+
+    def stream_data(self, config: dict, chunksize: int):
+        '''Load, clean, and preprocess the data a chunk at a time,
+        using the stored config and user_utils.
+
+        Args:
+            config: The config dict.
+            chunksize: Number of rows loaded per chunk.
+
+        Yields:
+            preprocessed_df: A chunk of the preprocessed data.
+            config: The config file, as updated by the user_utils.
+        '''
+        n_rows = 0
+        for raw_df, config in self.user_utils.load_data_chunks(config, chunksize):
+            cleaned_df, config = self.clean_data(raw_df, config)
+            preprocessed_df, config = self.preprocess_data(cleaned_df, config)
+
+            # Each chunk is indexed from zero, so offset it to keep the index unique
+            preprocessed_df.index = preprocessed_df.index + n_rows
+            n_rows += len(preprocessed_df)
+
+            yield preprocessed_df, config
 
     def clean_data(
             self,
@@ -54,10 +108,12 @@ class DataHandler:
             cleaned_df: The preprocessed data.
             config: The config file. This will also be stored at self.config
         '''
-        return self.user_utils.clean_data(
+        cleaned_df, config = self.user_utils.clean_data(
             raw_df, config
         )
 
+        return utils.stringify_mixed_columns(cleaned_df), config
+
     def preprocess_data(
             self,
             cleaned_df: pd.DataFrame,
@@ -75,96 +131,75 @@ class DataHandler:
             preprocessed_df: The preprocessed data.
             config: The config file. This will also be stored at self.config
         '''
-        return self.user_utils.preprocess_data(
+        preprocessed_df, config = self.user_utils.preprocess_data(
             cleaned_df, config
         )
+
+        return utils.stringify_mixed_columns(preprocessed_df), config
     
 
-    # Recategorization stuff
-    # v
-    '''
     def recategorize_data_per_grouping(
         self,
         preprocessed_df: pd.DataFrame,
-        groupby_column: dict,
+        groupby_column: str,
         new_cat_per_g: dict,
         combine_single_categories: bool = False,
     ) -> pd.Series:
-        The actual function doing most of the recategorizing.
+        '''The actual function doing most of the recategorizing.
+        Each rule is compiled once and evaluated on the distinct values
+        of the column, e.g. 'Science|Outreach', which are far fewer than the rows.
 
         Args:
             preprocessed_df: The dataframe containing the data to recategorize.
             groupby_column: The category to group the data by,
                 e.g. 'Research Topics'.
-            new_categories_per_grouping: The new categories to use
-                for this specific grouping.
+            new_cat_per_g: The new categories to use
+                for this specific grouping, keyed by name, with rules as values.
             combine_single_categories: If True, instead of leaving
                 undefined singly-tagged entries alone,
                 group them all into an "Other" category.
 
         Returns:
-            recategorized_series: The new categories.
-        
-
-        # Get the formatted data used for the categories
-        dummies = pd.get_dummies(preprocessed_df[groupby_column])
-        dummies['Title'] = preprocessed_df['Title']
-        dummies_grouped = dummies.groupby('Title')
-        bools = dummies_grouped.sum() >= 1
-        n_cats = bools.sum(axis='columns')
-        if bools.values.max() > 1:
-            raise ValueError(
-                'Categorization cannot proceed---'
-                'At least one category shows up multiple times'
-                'for a single ID.'
-            )
+            recategorized_series: The new categories, one per row.
+                Rows without tags are in the "Other" category.
+        '''
+        codes, value_tags, tags = indexes.get_value_tags(preprocessed_df[groupby_column])
+
+        # Which tags each distinct value has
+        tag_inds = {tag: i for i, tag in enumerate(tags)}
+        value_has_tag = np.zeros((len(value_tags), len(tags)), dtype=bool)
+        for i, tags_i in enumerate(value_tags):
+            value_has_tag[i, [tag_inds[tag] for tag in tags_i]] = True
 
         # Setup return arr
-        base_categories = bools.columns
-        recat_dtype = np.array(new_cat_per_g.keys()).dtype
-        recategorized_series = np.full(
-            len(bools), fill_value='Other', dtype=recat_dtype,
-        )
-        recategorized_series = pd.Series(
-            recategorized_series, index=bools.index, name=groupby_column
-        )
+        new_categories = list(dict.fromkeys(list(new_cat_per_g.keys()) + tags + ['Other',]))
+        category_inds = {category: i for i, category in enumerate(new_categories)}
+        value_categories = np.full(len(value_tags), category_inds['Other'])
 
         # Do all the single-category entries
         # These will be overridden if any are a subset of a new category
         if not combine_single_categories:
-            bools_singles = bools.loc[n_cats == 1]
-            for base_category in base_categories:
-                is_base_cat = bools_singles[base_category].values
-                base_cat_inds = bools_singles.index[is_base_cat]
-                recategorized_series.loc[base_cat_inds] = base_category
+            is_single = value_has_tag.sum(axis=1) == 1
+            value_categories[is_single] = [
+                category_inds[tags[i]] for i in value_has_tag[is_single].argmax(axis=1)
+            ]
 
-        # Loop through and do the recategorization
+        # Later categories take precedence over earlier ones
         for category_key, category_definition in new_cat_per_g.items():
-            # Replace the definition with something that can be evaluated
-            not_included_cats = []
-            for base_category in base_categories:
-                if base_category not in category_definition:
-                    not_included_cats.append(base_category)
-                    continue
-                category_definition = category_definition.replace(
-                    "'{}'".format(base_category),
-                    "row['{}']".format(base_category)
-                )
-            # Handle the not-included categories
-            if 'only' in category_definition:
-                category_definition = (
-                    '(' + category_definition + ') &'
-                    '(not (' + ' | '.join(
-                        ["row['{}']".format(cat) for cat in not_included_cats]
-                    ) + '))'
-                )
-                category_definition = category_definition.replace('only', '')
-
-            is_new_cat = bools.apply(
-                lambda row: eval(category_definition), axis='columns'
+            evaluate = category_rules.compile_rule(
+                category_rules.parse_rule(category_definition),
+                tags,
             )
-            recategorized_series[is_new_cat] = category_key
-            
+            value_categories[evaluate(value_has_tag)] = category_inds[category_key]
+
+        # The extra entry at the end is for missing values, which have code -1
+        row_codes = np.append(value_categories, category_inds['Other'])[codes]
+        recategorized_series = pd.Series(
+            pd.Categorical.from_codes(row_codes, new_categories).remove_unused_categories(),
+            index=preprocessed_df.index,
+            name=groupby_column,
+        )
+
         return recategorized_series
 
     def recategorize_data(
@@ -173,8 +208,9 @@ class DataHandler:
             new_categories: dict = None,
             recategorize: bool = True,
             combine_single_categories: bool = False,
+            load_fn=None,
         ) -> pd.DataFrame:
-        'Recategorize the data, i.e. combine existing categories into new ones.
+        '''Recategorize the data, i.e. combine existing categories into new ones.
         The end result is one category per article, so no articles are double-counted.
         However, if the new categories are ill-defined they can contradict one another
         and lead to inconsistencies.
@@ -186,72 +222,196 @@ class DataHandler:
             combine_single_categories: If True, instead of leaving
                 undefined singly-tagged entries alone,
                 group them all into an "Other" category.
+            load_fn: If given, used to get each recategorized column, e.g. from disk.
+                Accepts a key identifying the rules for the grouping and
+                a function that computes the column, and returns the column.
 
         Returns:
             recategorized: The dataframe containing the recategorized data.
-                One entry per article.
-        
+                One entry per article, in the same order as preprocessed_df.
+        '''
 
         # We include the automatic return to help with data caching.
         if not recategorize:
             return preprocessed_df
 
         if new_categories is None:
-            new_categories = self.config.get('new_categories', 0)
-        
-        # Get the condensed data frame
-        # This is probably dropping stuff that shouldn't be dropped!!!!!!!
-        recategorized = preprocessed_df.drop_duplicates(subset='Title', keep='first')
-        recategorized = recategorized.set_index('Title')
-
-        for groupby_column, new_categories_per_grouping in new_categories.items():
-
-            # Look for columns that are re-definitions of existing columns
-            # This regex looks for anything in front of anything else in brackets
-            search = re.findall(r'(.*?)\s\[(.+)\]', groupby_column)
-            if len(search) == 0:
-                new_column = groupby_column
-            elif len(search) == 1:
-                new_column, groupby_column = search[0]
-            else:
-                raise KeyError('New categories cannot have multiple sets of brackets.')
+            new_categories = self.config.get('new_categories', {})
 
-
-            recategorized_groupby = self.recategorize_data_per_grouping(
+        recategorized_columns = {}
+        for grouping, new_categories_per_grouping in new_categories.items():
+            new_column, groupby_column = category_rules.get_source_column(grouping)
+            compute_fn = functools.partial(
+                self.recategorize_data_per_grouping,
                 preprocessed_df,
                 groupby_column,
-                copy.deepcopy(new_categories_per_grouping),
-                combine_single_categories
+                new_categories_per_grouping,
+                combine_single_categories,
             )
+            if load_fn is None:
+                recategorized_columns[new_column] = compute_fn()
+            else:
+                # Each grouping is keyed separately, so editing the rules
+                # for one grouping doesn't require recomputing the others
+                rules_key = category_rules.get_rules_key(
+                    groupby_column,
+                    new_categories_per_grouping,
+                    combine_single_categories,
+                )
+                recategorized_columns[new_column] = load_fn(rules_key, compute_fn)
 
-            recategorized[new_column] = recategorized_groupby
+        return preprocessed_df.assign(**recategorized_columns)
 
-        recategorized.reset_index(inplace=True)
+    def build_indexes(self, preprocessed_df: pd.DataFrame, config: dict) -> dict:
+        '''Build the indexes used to filter the data quickly.
+
+        Args:
+            preprocessed_df: The preprocessed data, one row per entry.
+            config: The config dict.
+
+        Returns:
+            data_indexes: Dict of indexes, keyed by type.
+        '''
+        data_indexes = self.build_grouping_indexes(preprocessed_df, config['groupings'], config)
+        data_indexes['text'] = indexes.TextIndex.from_frame(
+            preprocessed_df,
+            config.get('text_columns', []),
+        )
+        data_indexes['sorted'] = indexes.SortedIndex.from_frame(
+            preprocessed_df,
+            config.get('numerical_columns', []) + config.get('date_columns', []),
+        )
+        data_indexes['fiscal'] = indexes.FiscalPeriods.from_series(
+            preprocessed_df[config['date_columns'][0]],
+        )
+
+        return data_indexes
+
+    def build_grouping_indexes(
+        self,
+        preprocessed_df: pd.DataFrame,
+        groupings: list[str],
+        config: dict,
+    ) -> dict:
+        '''Build the indexes that depend on the categories, e.g. for
+        recategorized data, whose other columns are unchanged.
+
+        Args:
+            preprocessed_df: The data, one row per entry.
+            groupings: The multi-label columns to index.
+            config: The config dict.
+
+        Returns:
+            data_indexes: Dict of indexes, keyed by type.
+        '''
+        return {
+            'bitmaps': indexes.BitmapIndex.from_frame(preprocessed_df, groupings),
+            'pairs': {
+                column: indexes.PairTable.from_series(preprocessed_df[column])
+                for column in groupings
+            },
+            'cube': indexes.DataCube.from_frame(
+                preprocessed_df,
+                config['date_columns'][0],
+                groupings,
+                config.get('id_columns', []),
+                config.get('numerical_columns', []),
+            ),
+        }
 
-        return recategorized
-'''
     def filter_data(
         self,
         preprocessed_df: pd.DataFrame,
         filters: dict,
+        data_indexes: dict = None,
+        explode_column: str = None,
     ) -> pd.DataFrame:
         '''Filter what data shows up in the dashboard.
+        Categorical columns can have multiple tags per entry, e.g. 'Science|Outreach'.
+        An entry is included if it has at least one of the selected tags
+        in every filtered column.
 
         Args:
-            recategorized_df: The dataframe containing the data.
-            categorical_filters (dict): How categories are filtered.
+            preprocessed_df: The dataframe containing the data, one row per entry.
+            filters: The filters. filters['categorical'] holds the selected
+                tags, keyed by column, filters['numerical'] holds the inclusive
+                (low, high) range of numerical and date columns, keyed by column,
+                and filters['text'] holds a search query for the text columns.
+            data_indexes: The indexes of preprocessed_df, from build_indexes.
+                Columns that aren't indexed are handled by splitting up the column.
+            explode_column: If given, the selected data gets one row per
+                selected tag in this column.
 
         Returns:
             selected_df: The dataframe containing the selected data.
         '''
+        if data_indexes is None:
+            data_indexes = {}
+
         # Initialized
         is_included = np.ones(len(preprocessed_df), dtype=bool)
-        categorical_filters = filters['categorical']
+        categorical_filters = filters.get('categorical', {})
 
         # Categories filter
+        bitmap_index = data_indexes.get('bitmaps')
+        if bitmap_index is None:
+            indexed_filters = {}
+        else:
+            indexed_filters = {
+                column: selected_tags
+                for column, selected_tags in categorical_filters.items()
+                if column in bitmap_index.columns
+            }
+            is_included &= bitmap_index.filter(indexed_filters)
         for cat_filter_col, selected_cats in categorical_filters.items():
-            is_included = is_included & preprocessed_df[cat_filter_col].isin(selected_cats)
-
-        selected_df = preprocessed_df.loc[is_included]
+            if cat_filter_col in indexed_filters:
+                continue
+            is_included &= indexes.tags_isin(preprocessed_df[cat_filter_col], selected_cats)
+
+        # Numerical and date ranges
+        numerical_filters = filters.get('numerical', {})
+        sorted_index = data_indexes.get('sorted')
+        if sorted_index is None:
+            indexed_filters = {}
+        else:
+            indexed_filters = {
+                column: value_range
+                for column, value_range in numerical_filters.items()
+                if column in sorted_index.columns
+            }
+            is_included &= sorted_index.filter(indexed_filters)
+        for num_filter_col, (low, high) in numerical_filters.items():
+            if num_filter_col in indexed_filters:
+                continue
+            is_included &= indexes.values_in_range(preprocessed_df[num_filter_col], low, high)
+
+        # Text search
+        query = filters.get('text', '')
+        if query:
+            text_index = data_indexes.get('text')
+            if text_index is None:
+                is_included &= indexes.texts_contain(
+                    indexes.get_texts(preprocessed_df, self.config.get('text_columns', [])),
+                    query,
+                )
+            else:
+                is_included &= text_index.search(query)
+
+        if explode_column is None:
+            return preprocessed_df.loc[is_included]
+
+        # Only the selected entries are exploded,
+        # using the precomputed pairs when available
+        pair_table = data_indexes.get('pairs', {}).get(explode_column)
+        if pair_table is None:
+            return indexes.explode_tags(
+                preprocessed_df.loc[is_included],
+                explode_column,
+                categorical_filters.get(explode_column),
+            )
+        rows, codes = pair_table.select(is_included, categorical_filters.get(explode_column))
+        selected_df = preprocessed_df.iloc[rows].assign(
+            **{explode_column: pair_table.get_labels(codes)}
+        )
 
-        return selected_df
\ No newline at end of file
+        return selected_df
@@ -46,9 +46,14 @@ class DataViewer:
         '''
 
         if data_key is None:
+            # Only tables can be viewed, not e.g. the indexes
+            # Tables that are only computed when viewed are given as functions
             data_key = st_loc.radio(
                 'View what data?',
-                options=data.keys(),
+                options=[
+                    key for key, value in data.items()
+                    if isinstance(value, (pd.DataFrame, pd.Series)) or callable(value)
+                ],
                 horizontal=True,
             )
 
@@ -57,10 +62,12 @@ class DataViewer:
             return
 
         shown_df = data[data_key]
+        if callable(shown_df):
+            shown_df = shown_df()
         if columns is not None:
             shown_df = shown_df[columns]
 
-        st.write(data[data_key])
+        st.write(shown_df)
 
     def lineplot(
         self,
@@ -314,7 +321,7 @@ class DataViewer:
         if totals is not None:
             #print(xs)
             #print(len(xs))
-            df['totals'] = totals.to_list()
+            df = df.assign(totals=totals.to_list())
         categories = df.columns
         
         for category_j in list(categories):
@@ -0,0 +1,97 @@
+'''Module for handles to the data that identify it by version,
+so cached functions can be keyed without hashing the data itself.
+
+Prepared and derived data is shared by every session in the server process,
+so it's never modified in place. Sessions get views of it, and any stage that
+changes the data makes a new frame, e.g. with assign, and a new handle with derive.
+'''
+import pandas as pd
+
+from . import store
+
+
+def view(df: pd.DataFrame) -> pd.DataFrame:
+    '''Get a view of a shared dataframe that can be used without affecting it.
+    This relies on copy-on-write, which the dashboard turns on: the data is shared,
+    and only the columns that are later written to are copied.
+
+    Args:
+        df: The shared dataframe.
+
+    Returns:
+        df_view: The view.
+    '''
+    return df.copy(deep=False)
+
+
+def normalize_filters(filters: dict) -> dict:
+    '''Put filters in a canonical form, so filters that select the same data
+    give it the same version: selected tags are sorted and deduplicated,
+    and filters that don't exclude anything, e.g. an empty text search, are dropped.
+    An empty list of selected tags excludes everything, so it's kept.
+
+    Args:
+        filters: The filters, e.g. filters['categorical'] for how categories are filtered.
+
+    Returns:
+        normalized: The filters in canonical form.
+    '''
+    normalized = {}
+    if filters.get('categorical'):
+        normalized['categorical'] = {
+            column: sorted(set(selected_tags))
+            for column, selected_tags in filters['categorical'].items()
+        }
+    if filters.get('numerical'):
+        normalized['numerical'] = {
+            column: list(value_range)
+            for column, value_range in filters['numerical'].items()
+        }
+    if filters.get('text'):
+        normalized['text'] = filters['text']
+
+    return normalized
+
+
+class Dataset:
+    '''Handle for a dataframe and its indexes, identified by a version token.
+    The token is set when the data is prepared, and data derived from it
+    gets a token built from the parent's token and how it was derived.
+    Two datasets with the same token are assumed to hold the same data,
+    so the dataframe must not be modified after the handle is made.
+
+    Args:
+        df: The data.
+        version: Token identifying the data, e.g. the key of the shared data.
+        indexes: Dict of indexes of df, keyed by type. Empty if not given.
+    '''
+
+    def __init__(self, df: pd.DataFrame, version: str, indexes: dict = None):
+        self.df = df
+        self.version = version
+        self.indexes = {} if indexes is None else indexes
+
+    def derive(self, df: pd.DataFrame, operation: str, indexes: dict = None, **params):
+        '''Make a handle for data derived from this dataset.
+
+        Args:
+            df: The derived data.
+            operation: Name of how the data was derived, e.g. 'filter'.
+            indexes: Indexes of the derived data, if any.
+            **params: Everything else the derived data depends on.
+                Must be json-serializable.
+
+        Returns:
+            derived: Handle for the derived data.
+        '''
+        version = store.hash_object([self.version, operation, params])
+        return Dataset(df, version, indexes)
+
+    def view(self):
+        '''Get a handle to a view of this dataset, sharing its data and indexes.
+
+        Returns:
+            dataset_view: Handle with the same version.
+        '''
+        return Dataset(view(self.df), self.version, self.indexes)
+
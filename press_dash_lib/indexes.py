@@ -0,0 +1,958 @@
+'''Module for indexes built once when the data is prepared,
+so that interactive filtering doesn't need to scan the data.
+'''
+import re
+
+import numpy as np
+import pandas as pd
+
+from . import utils
+
+
+def split_tags(value, sep: str = '|') -> list:
+    '''Split a multi-label value, e.g. 'Science|Outreach', into its tags.
+
+    Args:
+        value: The value to split. Missing values have no tags.
+        sep: The separator between tags.
+
+    Returns:
+        tags: The tags, in order, with surrounding whitespace removed.
+    '''
+    if not isinstance(value, str):
+        return []
+    return [tag.strip() for tag in value.split(sep)]
+
+
+def get_value_tags(series: pd.Series, sep: str = '|'):
+    '''Split each distinct value of a multi-label column into tags.
+    Columns have far fewer distinct values than rows,
+    so this is much cheaper than splitting every row.
+
+    Args:
+        series: The multi-label column.
+        sep: The separator between tags.
+
+    Returns:
+        codes: For each row, the index of its distinct value (-1 if missing).
+        value_tags: For each distinct value, its tags.
+        tags: All the tags, in the order they first appear in the column.
+    '''
+    codes, uniques = pd.factorize(series)
+    value_tags = [split_tags(value, sep) for value in uniques]
+    tags = list(dict.fromkeys(tag for tags_i in value_tags for tag in tags_i))
+
+    return codes, value_tags, tags
+
+
+def get_tags(series: pd.Series, sep: str = '|') -> list:
+    '''Get all the tags that appear in a multi-label column.
+
+    Args:
+        series: The multi-label column.
+        sep: The separator between tags.
+
+    Returns:
+        tags: The tags, in the order they first appear in the column.
+    '''
+    return get_value_tags(series, sep)[2]
+
+
+def tags_isin(series: pd.Series, selected_tags: list, sep: str = '|') -> np.ndarray:
+    '''Find which rows of a multi-label column have any of the selected tags.
+
+    Args:
+        series: The multi-label column.
+        selected_tags: The tags to look for.
+        sep: The separator between tags.
+
+    Returns:
+        is_included: True for rows with at least one selected tag.
+    '''
+    codes, value_tags, _ = get_value_tags(series, sep)
+    selected_tags = set(selected_tags)
+    # The extra entry at the end is for missing values, which have code -1
+    value_is_included = np.array(
+        [len(selected_tags.intersection(tags_i)) > 0 for tags_i in value_tags] + [False,]
+    )
+
+    return value_is_included[codes]
+
+
+def explode_tags(
+    df: pd.DataFrame,
+    column: str,
+    selected_tags: list = None,
+    sep: str = '|',
+) -> pd.DataFrame:
+    '''Give each tag of a multi-label column its own row.
+    The index is kept, so rows for the same entry share an index value.
+
+    Args:
+        df: The data to explode.
+        column: The multi-label column.
+        selected_tags: If given, only rows for these tags are kept.
+        sep: The separator between tags.
+
+    Returns:
+        exploded_df: The exploded data.
+    '''
+    exploded_df = df.copy()
+    exploded_df[column] = df[column].str.split(sep)
+    exploded_df = exploded_df.explode(column)
+    exploded_df[column] = exploded_df[column].str.strip()
+    if selected_tags is not None:
+        exploded_df = exploded_df.loc[exploded_df[column].isin(selected_tags)]
+
+    return exploded_df
+
+
+class PairTable:
+    '''Exploded form of a multi-label column, stored as one
+    (row, tag code) pair per tag per row. Selecting and exploding
+    entries is then integer indexing, with no string operations.
+    Pairs are in the same order explode_tags would give them.
+
+    Args:
+        n_rows: The number of rows in the column.
+        rows: For each pair, the position of its row.
+        codes: For each pair, the position of its tag in tags.
+        tags: The tags, in the order they first appear in the column.
+    '''
+
+    def __init__(self, n_rows: int, rows: np.ndarray, codes: np.ndarray, tags: list):
+        self.n_rows = n_rows
+        self.rows = rows
+        self.codes = codes
+        self.tags = tags
+        self.tag_inds = {tag: i for i, tag in enumerate(tags)}
+
+    @classmethod
+    def from_series(cls, series: pd.Series, sep: str = '|'):
+        '''Build the pair table.
+
+        Args:
+            series: The multi-label column.
+            sep: The separator between tags.
+
+        Returns:
+            pair_table: The pair table.
+        '''
+        value_codes, value_tags, tags = get_value_tags(series, sep)
+        tag_inds = {tag: i for i, tag in enumerate(tags)}
+        code_dtype = np.min_scalar_type(max(len(tags) - 1, 0))
+
+        # The tag codes of every distinct value, end to end. The extra
+        # entry at the end is for missing values, which have no tags.
+        n_value_tags = np.array([len(tags_i) for tags_i in value_tags] + [0,])
+        value_starts = np.concatenate([[0,], np.cumsum(n_value_tags)[:-1]])
+        flat_codes = np.array(
+            [tag_inds[tag] for tags_i in value_tags for tag in tags_i],
+            dtype=code_dtype,
+        )
+
+        # Each row's pairs are its value's slice of flat_codes
+        n_row_tags = n_value_tags[value_codes]
+        rows = np.repeat(np.arange(len(series), dtype=np.int32), n_row_tags)
+        pair_starts = np.cumsum(n_row_tags) - n_row_tags
+        offsets = np.arange(len(rows)) - np.repeat(pair_starts, n_row_tags)
+        codes = flat_codes[np.repeat(value_starts[value_codes], n_row_tags) + offsets]
+
+        return cls(len(series), rows, codes, tags)
+
+    def select(
+        self,
+        is_included: np.ndarray = None,
+        selected_tags: list = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        '''Get the pairs for the included rows and selected tags.
+
+        Args:
+            is_included: True for rows to include. Defaults to all rows.
+            selected_tags: The tags to include. Defaults to all tags.
+
+        Returns:
+            rows: For each selected pair, the position of its row.
+            codes: For each selected pair, the position of its tag in tags.
+        '''
+        is_selected = np.ones(len(self.rows), dtype=bool)
+        if is_included is not None:
+            is_selected &= is_included[self.rows]
+        if selected_tags is not None:
+            tag_is_selected = np.zeros(len(self.tags), dtype=bool)
+            tag_is_selected[[
+                self.tag_inds[tag] for tag in selected_tags if tag in self.tag_inds
+            ]] = True
+            is_selected &= tag_is_selected[self.codes]
+
+        return self.rows[is_selected], self.codes[is_selected]
+
+    def get_labels(self, codes: np.ndarray) -> np.ndarray:
+        '''Convert tag codes to tags.
+
+        Args:
+            codes: Positions of tags in tags.
+
+        Returns:
+            labels: The tags.
+        '''
+        return np.array(self.tags, dtype=object)[codes]
+
+
+class BitmapIndex:
+    '''Index of which rows have each tag of multi-label columns.
+    Each tag gets a bitset with one bit per row, packed eight rows
+    to a byte, so filtering is a few bitwise operations over small arrays.
+
+    Args:
+        n_rows: The number of rows indexed.
+        tags: For each column, its tags.
+        bitsets: For each column, an array of shape (n_tags, n_bytes)
+            holding the packed bitset of each tag.
+    '''
+
+    def __init__(self, n_rows: int, tags: dict, bitsets: dict):
+        self.n_rows = n_rows
+        self.tags = tags
+        self.bitsets = bitsets
+        self.tag_inds = {
+            column: {tag: i for i, tag in enumerate(column_tags)}
+            for column, column_tags in tags.items()
+        }
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, columns: list[str], sep: str = '|'):
+        '''Build the index.
+
+        Args:
+            df: The data, one row per entry.
+            columns: The multi-label columns to index.
+            sep: The separator between tags.
+
+        Returns:
+            bitmap_index: The index.
+        '''
+        tags = {}
+        bitsets = {}
+        for column in columns:
+            codes, value_tags, column_tags = get_value_tags(df[column], sep)
+            tag_inds = {tag: i for i, tag in enumerate(column_tags)}
+
+            # Which tags each distinct value has. The extra row at the end
+            # is for missing values, which have code -1.
+            value_has_tag = np.zeros((len(value_tags) + 1, len(column_tags)), dtype=bool)
+            for i, tags_i in enumerate(value_tags):
+                value_has_tag[i, [tag_inds[tag] for tag in tags_i]] = True
+
+            tags[column] = column_tags
+            bitsets[column] = np.packbits(value_has_tag[codes].T, axis=1)
+
+        return cls(len(df), tags, bitsets)
+
+    @property
+    def columns(self) -> list[str]:
+        '''The columns that are indexed.'''
+        return list(self.tags.keys())
+
+    def get_packed_mask(self, column: str, selected_tags: list) -> np.ndarray:
+        '''Get the packed bitset of rows with any of the selected tags.
+
+        Args:
+            column: The column the tags belong to.
+            selected_tags: The tags to look for. Tags not in the data are ignored.
+
+        Returns:
+            packed_mask: The bitset, packed eight rows to a byte.
+        '''
+        inds = [
+            self.tag_inds[column][tag] for tag in selected_tags
+            if tag in self.tag_inds[column]
+        ]
+        packed_mask = np.bitwise_or.reduce(
+            self.bitsets[column][inds],
+            axis=0,
+            initial=0,
+        )
+        return packed_mask.astype(np.uint8)
+
+    def filter(self, categorical_filters: dict) -> np.ndarray:
+        '''Find the rows that have at least one selected tag in every column.
+
+        Args:
+            categorical_filters: The selected tags, keyed by column.
+                Every column must be indexed.
+
+        Returns:
+            is_included: True for rows that pass all the filters.
+        '''
+        packed_mask = np.full((self.n_rows + 7) // 8, 255, dtype=np.uint8)
+        for column, selected_tags in categorical_filters.items():
+            packed_mask &= self.get_packed_mask(column, selected_tags)
+
+        return np.unpackbits(packed_mask, count=self.n_rows).view(bool)
+
+
+def get_texts(df: pd.DataFrame, columns: list[str]) -> np.ndarray:
+    '''Combine the text columns of each row into one lowercase string.
+    Columns are joined by newlines, so a search term never matches
+    across two columns.
+
+    Args:
+        df: The data.
+        columns: The text columns. Columns not in df are skipped.
+
+    Returns:
+        texts: One string per row.
+    '''
+    columns = [column for column in columns if column in df.columns]
+    texts = pd.Series('', index=df.index, dtype=object)
+    for column in columns:
+        texts = texts + '\n' + df[column].astype(object).fillna('').astype(str).str.lower()
+
+    return texts.to_numpy(dtype=object)
+
+
+def get_search_terms(query: str) -> list[str]:
+    '''Split a search query into terms. Each term must be found in an entry,
+    as part of a word or a whole word, for the entry to match.
+
+    Args:
+        query: The query, e.g. 'black hole'.
+
+    Returns:
+        terms: The lowercase terms, e.g. ['black', 'hole'].
+    '''
+    return query.lower().split()
+
+
+def texts_contain(texts: np.ndarray, query: str) -> np.ndarray:
+    '''Find which texts contain every term of a query by scanning them.
+    Used when there's no text index.
+
+    Args:
+        texts: The texts to search, from get_texts.
+        query: The query.
+
+    Returns:
+        is_included: True for texts containing every term.
+    '''
+    terms = get_search_terms(query)
+    return np.fromiter(
+        (all(term in text for term in terms) for text in texts),
+        dtype=bool,
+        count=len(texts),
+    )
+
+
+class Postings:
+    '''Inverted lists: for each term, the sorted positions of the rows
+    containing it. The lists are stored end to end in a single array,
+    with the terms sorted so they can be found with a binary search.
+
+    Args:
+        terms: The sorted terms.
+        offsets: Where each term's rows start in rows, plus the total length.
+        rows: The row positions for every term, end to end.
+    '''
+
+    def __init__(self, terms: np.ndarray, offsets: np.ndarray, rows: np.ndarray):
+        self.terms = terms
+        self.offsets = offsets
+        self.rows = rows
+
+    @classmethod
+    def from_pairs(cls, terms: list[str], rows: list[int]):
+        '''Build the postings.
+
+        Args:
+            terms: For each pair, the term. Each (term, row) pair must be unique.
+            rows: For each pair, the position of the row containing the term.
+
+        Returns:
+            postings: The postings.
+        '''
+        # Sorting only the distinct terms is much faster than sorting every pair
+        codes, uniques = pd.factorize(np.array(terms, dtype=object))
+        term_order = np.argsort(uniques)
+        term_ranks = np.empty(len(uniques), dtype=np.int64)
+        term_ranks[term_order] = np.arange(len(uniques))
+        terms = uniques[term_order]
+        inverse = term_ranks[codes]
+
+        rows = np.asarray(rows, dtype=np.int32)
+        order = np.lexsort((rows, inverse))
+        counts = np.bincount(inverse, minlength=len(terms))
+        offsets = np.concatenate([[0,], np.cumsum(counts)])
+
+        return cls(terms, offsets, rows[order])
+
+    def get(self, term: str) -> np.ndarray:
+        '''Get the rows containing a term.
+
+        Args:
+            term: The term.
+
+        Returns:
+            rows: Sorted positions of the rows containing the term.
+        '''
+        i = np.searchsorted(self.terms, term)
+        if i == len(self.terms) or self.terms[i] != term:
+            return self.rows[:0]
+        return self.rows[self.offsets[i]:self.offsets[i + 1]]
+
+    def get_containing(self, substring: str) -> np.ndarray:
+        '''Get the rows with any term containing a substring.
+
+        Args:
+            substring: The substring.
+
+        Returns:
+            rows: Sorted positions of the rows.
+        '''
+        inds = [i for i, term in enumerate(self.terms) if substring in term]
+        if len(inds) == 0:
+            return self.rows[:0]
+        return np.unique(np.concatenate([
+            self.rows[self.offsets[i]:self.offsets[i + 1]] for i in inds
+        ]))
+
+
+class TextIndex:
+    '''Index for searching text columns. A term with three or more
+    characters is looked up by its trigrams (every run of three characters).
+    The rows that have all of those trigrams are then checked, which
+    is usually a small fraction of the data. Shorter terms are matched
+    against the vocabulary of words instead.
+
+    Args:
+        texts: The lowercase text of each row, from get_texts.
+        words: Postings for each word.
+        trigrams: Postings for each trigram.
+    '''
+
+    def __init__(self, texts: np.ndarray, words: Postings, trigrams: Postings):
+        self.texts = texts
+        self.words = words
+        self.trigrams = trigrams
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, columns: list[str]):
+        '''Build the index.
+
+        Args:
+            df: The data, one row per entry.
+            columns: The text columns to index. Columns not in df are skipped.
+
+        Returns:
+            text_index: The index.
+        '''
+        texts = get_texts(df, columns)
+
+        word_terms, word_rows = [], []
+        trigram_terms, trigram_rows = [], []
+        for i, text in enumerate(texts):
+            words_i = set(re.findall(r'\w+', text))
+            word_terms += words_i
+            word_rows += [i,] * len(words_i)
+
+            # Terms never contain whitespace, so neither do the trigrams we need
+            trigrams_i = {
+                chunk[j:j + 3]
+                for chunk in text.split()
+                for j in range(len(chunk) - 2)
+            }
+            trigram_terms += trigrams_i
+            trigram_rows += [i,] * len(trigrams_i)
+
+        return cls(
+            texts,
+            Postings.from_pairs(word_terms, word_rows),
+            Postings.from_pairs(trigram_terms, trigram_rows),
+        )
+
+    def get_rows(self, term: str) -> np.ndarray:
+        '''Get the rows containing a search term.
+
+        Args:
+            term: The lowercase term.
+
+        Returns:
+            rows: Sorted positions of the rows containing the term.
+        '''
+        if len(term) < 3:
+            if re.fullmatch(r'\w+', term):
+                return self.words.get_containing(term)
+            # Punctuation isn't part of any word, so these are rare enough to scan for
+            return np.flatnonzero(texts_contain(self.texts, term))
+
+        # Intersect starting with the rarest trigram, so the candidates shrink fastest
+        trigram_rows = sorted(
+            (self.trigrams.get(term[j:j + 3]) for j in range(len(term) - 2)),
+            key=len,
+        )
+        candidates = trigram_rows[0]
+        for rows in trigram_rows[1:]:
+            if len(candidates) == 0:
+                break
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+
+        # Having all the trigrams doesn't guarantee they're in order
+        if len(term) == 3:
+            return candidates
+        is_match = np.fromiter(
+            (term in self.texts[row] for row in candidates),
+            dtype=bool,
+            count=len(candidates),
+        )
+        return candidates[is_match]
+
+    def search(self, query: str) -> np.ndarray:
+        '''Find the rows containing every term of a query.
+
+        Args:
+            query: The query, e.g. 'black hole'.
+
+        Returns:
+            is_included: True for rows containing every term.
+        '''
+        is_included = np.ones(len(self.texts), dtype=bool)
+        for term in get_search_terms(query):
+            is_term_included = np.zeros(len(self.texts), dtype=bool)
+            is_term_included[self.get_rows(term)] = True
+            is_included &= is_term_included
+
+        return is_included
+
+
+class SortedIndex:
+    '''Index for range filters on numerical and date columns.
+    For each column, the row positions are stored in order of their values,
+    so the rows in a range are a contiguous slice, found with two binary searches.
+
+    Args:
+        n_rows: The number of rows indexed.
+        orders: For each column, the positions of the rows with values,
+            sorted by value.
+        sorted_values: For each column, the values in sorted order.
+    '''
+
+    def __init__(self, n_rows: int, orders: dict, sorted_values: dict):
+        self.n_rows = n_rows
+        self.orders = orders
+        self.sorted_values = sorted_values
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, columns: list[str]):
+        '''Build the index.
+
+        Args:
+            df: The data, one row per entry.
+            columns: The numerical and date columns to index.
+                Columns not in df are skipped.
+
+        Returns:
+            sorted_index: The index.
+        '''
+        orders = {}
+        sorted_values = {}
+        for column in columns:
+            if column not in df.columns:
+                continue
+
+            # Missing values can't be in any range, so they're left out
+            is_valid = df[column].notna().to_numpy()
+            values = df[column].loc[is_valid]
+            if pd.api.types.is_datetime64_any_dtype(values):
+                values = values.to_numpy()
+            else:
+                values = values.to_numpy(dtype=float)
+            order = np.argsort(values, kind='stable')
+
+            orders[column] = np.flatnonzero(is_valid).astype(np.int32)[order]
+            sorted_values[column] = values[order]
+
+        return cls(len(df), orders, sorted_values)
+
+    @property
+    def columns(self) -> list[str]:
+        '''The columns that are indexed.'''
+        return list(self.orders.keys())
+
+    def get_bounds(self, column: str) -> tuple:
+        '''Get the smallest and largest values of a column.
+
+        Args:
+            column: The column.
+
+        Returns:
+            bounds: The (min, max) values, or None if the column has no values.
+        '''
+        values = self.sorted_values[column]
+        if len(values) == 0:
+            return None
+        return values[0], values[-1]
+
+    def get_rows(self, column: str, low=None, high=None) -> np.ndarray:
+        '''Get the rows with values in a range.
+
+        Args:
+            column: The column.
+            low: The smallest value included. Defaults to no lower bound.
+            high: The largest value included. Defaults to no upper bound.
+
+        Returns:
+            rows: Positions of the rows in the range, in order of value.
+        '''
+        values = self.sorted_values[column]
+        if np.issubdtype(values.dtype, np.datetime64):
+            convert = lambda bound: pd.Timestamp(bound).to_datetime64()
+        else:
+            convert = float
+        start = 0 if low is None else np.searchsorted(values, convert(low), side='left')
+        stop = len(values) if high is None else np.searchsorted(values, convert(high), side='right')
+
+        return self.orders[column][start:stop]
+
+    def filter(self, numerical_filters: dict) -> np.ndarray:
+        '''Find the rows that are in range for every column.
+
+        Args:
+            numerical_filters: The (low, high) range of each column, inclusive.
+                Either bound can be None. Every column must be indexed.
+
+        Returns:
+            is_included: True for rows that pass all the filters.
+        '''
+        is_included = np.ones(self.n_rows, dtype=bool)
+        for column, (low, high) in numerical_filters.items():
+            is_in_range = np.zeros(self.n_rows, dtype=bool)
+            is_in_range[self.get_rows(column, low, high)] = True
+            is_included &= is_in_range
+
+        return is_included
+
+
+def values_in_range(series: pd.Series, low=None, high=None) -> np.ndarray:
+    '''Find which rows of a column have values in a range by scanning them.
+    Used when the column isn't indexed.
+
+    Args:
+        series: The numerical or date column.
+        low: The smallest value included. Defaults to no lower bound.
+        high: The largest value included. Defaults to no upper bound.
+
+    Returns:
+        is_included: True for rows in the range.
+    '''
+    is_included = series.notna().to_numpy(copy=True)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        convert = pd.Timestamp
+    else:
+        convert = float
+    if low is not None:
+        is_included &= (series >= convert(low)).fillna(False).to_numpy(dtype=bool)
+    if high is not None:
+        is_included &= (series <= convert(high)).fillna(False).to_numpy(dtype=bool)
+
+    return is_included
+
+
+class FiscalPeriods:
+    '''The fiscal year and fiscal month of each row, for every month
+    the year could start on. Choosing a different start month is then
+    a choice of row in the arrays, with no re-binning. Kept alongside
+    the indexes rather than as columns, so they don't show up in the data.
+    The fiscal year is the calendar year the fiscal year starts in,
+    and the fiscal month counts from 1 at the start month.
+    Rows without a date get 0 for both.
+
+    Args:
+        years: Array of shape (12, n_rows), one row per start month.
+        months: Array of shape (12, n_rows), one row per start month.
+    '''
+
+    def __init__(self, years: np.ndarray, months: np.ndarray):
+        self.years = years
+        self.months = months
+
+    @classmethod
+    def from_series(cls, dates: pd.Series):
+        '''Compute the fiscal periods.
+
+        Args:
+            dates: The date of each row.
+
+        Returns:
+            fiscal_periods: The fiscal periods.
+        '''
+        return cls(*utils.get_fiscal_periods(dates, range(1, 13)))
+
+    def get(self, start_month: int, rows: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+        '''Get the fiscal periods for one start month.
+
+        Args:
+            start_month: The month the fiscal year starts on.
+            rows: Positions of the rows to get. Defaults to all rows.
+
+        Returns:
+            years: The fiscal year of each row.
+            months: The fiscal month of each row.
+        '''
+        years = self.years[start_month - 1]
+        months = self.months[start_month - 1]
+        if rows is None:
+            return years, months
+        return years[rows], months[rows]
+
+
+class DataCube:
+    '''Pre-aggregated stats, so the dashboard's aggregations can be answered
+    without touching the rows. For each grouping, the entries are counted and
+    summed per calendar month and per distinct value of the grouping,
+    e.g. 'Science|Outreach'. Each entry has exactly one value, so adding up
+    values never counts an entry twice, and a category's stats are the sum
+    over the values that have it. Any fiscal year is a set of calendar months,
+    so every start month is answered from the same cube.
+
+    Args:
+        first_month: The first month covered, as months since 1970-01.
+        n_months: The number of months covered.
+        tags: For each grouping, its tags.
+        value_has_tag: For each grouping, an array of shape (n_values, n_tags)
+            that is True where the value has the tag.
+        counts: For each grouping, the number of entries, shape (n_months, n_values).
+        sums: For each grouping, a dict of the sums of each numerical column,
+            shape (n_months, n_values).
+        count_columns: The columns whose distinct values can be counted from the cube,
+            i.e. those with one distinct value per entry. Counts of other columns,
+            e.g. a Title shared by several entries, are always aggregated from the entries.
+        integer_columns: The numerical columns that hold integers.
+    '''
+
+    def __init__(
+        self,
+        first_month: int,
+        n_months: int,
+        tags: dict,
+        value_has_tag: dict,
+        counts: dict,
+        sums: dict,
+        count_columns: list[str],
+        integer_columns: list[str],
+    ):
+        self.first_month = first_month
+        self.n_months = n_months
+        self.tags = tags
+        self.value_has_tag = value_has_tag
+        self.counts = counts
+        self.sums = sums
+        self.count_columns = count_columns
+        self.integer_columns = integer_columns
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        date_column: str,
+        groupings: list[str],
+        id_columns: list[str],
+        numerical_columns: list[str],
+        sep: str = '|',
+    ):
+        '''Build the cube.
+
+        Args:
+            df: The data, one row per entry.
+            date_column: The column holding the date of each entry.
+            groupings: The multi-label columns to group by.
+            id_columns: The columns whose distinct values are counted.
+            numerical_columns: The columns that are summed.
+            sep: The separator between tags.
+
+        Returns:
+            data_cube: The cube.
+        '''
+        months = df[date_column].to_numpy(dtype='datetime64[M]')
+        has_date = ~np.isnat(months)
+        months = months.astype(np.int64)
+        first_month = int(months[has_date].min()) if has_date.any() else 0
+        n_months = int(months[has_date].max()) - first_month + 1 if has_date.any() else 0
+        month_offsets = months - first_month
+
+        numerical_columns = [_ for _ in numerical_columns if _ in df.columns]
+        weights = {
+            column: np.nan_to_num(
+                pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+            )
+            for column in numerical_columns
+        }
+
+        tags = {}
+        value_has_tag = {}
+        counts = {}
+        sums = {}
+        for column in groupings:
+            codes, value_tags, column_tags = get_value_tags(df[column], sep)
+            tag_inds = {tag: i for i, tag in enumerate(column_tags)}
+            value_has_tag[column] = np.zeros((len(value_tags), len(column_tags)), dtype=bool)
+            for i, tags_i in enumerate(value_tags):
+                value_has_tag[column][i, [tag_inds[tag] for tag in tags_i]] = True
+            tags[column] = column_tags
+
+            # Entries without a date or tags don't show up in any aggregation
+            is_used = has_date & (codes >= 0)
+            cells = month_offsets[is_used] * len(value_tags) + codes[is_used]
+            n_cells = n_months * len(value_tags)
+            counts[column] = np.bincount(cells, minlength=n_cells).reshape(n_months, -1)
+            sums[column] = {
+                weight_column: np.bincount(
+                    cells,
+                    weights=column_weights[is_used],
+                    minlength=n_cells,
+                ).reshape(n_months, -1)
+                for weight_column, column_weights in weights.items()
+            }
+
+        count_columns = [
+            column for column in id_columns
+            if column in df.columns and df[column].notna().all() and df[column].is_unique
+        ]
+        integer_columns = [
+            column for column in numerical_columns
+            if pd.api.types.is_integer_dtype(df[column])
+        ]
+
+        return cls(
+            first_month,
+            n_months,
+            tags,
+            value_has_tag,
+            counts,
+            sums,
+            count_columns,
+            integer_columns,
+        )
+
+    def can_aggregate(
+        self,
+        groupby_column: str,
+        y_column: str,
+        aggregation_method: str,
+        filters: dict,
+    ) -> bool:
+        '''Check if an aggregation can be answered from the cube.
+        The cube can't apply text or range filters, or category filters
+        on columns other than the groupby column.
+
+        Args:
+            groupby_column: The category to group the data by.
+            y_column: What to count up or sum.
+            aggregation_method: How to aggregate, 'count' or 'sum'.
+            filters: The filters, as used by filter_data.
+
+        Returns:
+            can_aggregate: True if the cube has the answer.
+        '''
+        if groupby_column not in self.tags:
+            return False
+        if aggregation_method == 'count' and y_column not in self.count_columns:
+            return False
+        if aggregation_method == 'sum' and y_column not in self.sums[groupby_column]:
+            return False
+        if filters.get('text') or filters.get('numerical'):
+            return False
+        categorical_filters = filters.get('categorical', {})
+        if any(column != groupby_column for column in categorical_filters):
+            return False
+        # An empty selection is left to the row-level path, which handles empty data
+        selected_tags = categorical_filters.get(groupby_column)
+        if selected_tags is not None and not set(selected_tags).intersection(self.tags[groupby_column]):
+            return False
+
+        return True
+
+    def aggregate(
+        self,
+        groupby_column: str,
+        y_column: str,
+        aggregation_method: str,
+        selected_tags: list = None,
+        start_month: int = 1,
+        year_start: int = None,
+        year_end: int = None,
+        by_month: bool = False,
+    ) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        '''Aggregate stats per category and in total, in the same form
+        as Aggregator.aggregate_with_totals.
+
+        Args:
+            groupby_column: The category to group the data by.
+            y_column: What to count up or sum.
+            aggregation_method: How to aggregate, 'count' or 'sum'.
+            selected_tags: The categories to include. Defaults to all.
+            start_month: The month the fiscal year starts on, 1-12.
+            year_start: The first fiscal year included. Defaults to the first in the data.
+            year_end: The last fiscal year included. Defaults to the last in the data.
+            by_month: If True, the x values are calendar month names,
+                as used for viewing a single year. Otherwise they're fiscal years.
+
+        Returns:
+            aggregated: The dataframe containing the stats per x value per category.
+            totals: The dataframe containing the stats per x value,
+                counting each entry once.
+            total_by_instance: The stats per category across all x values.
+        '''
+        if aggregation_method == 'count':
+            table = self.counts[groupby_column]
+        else:
+            table = self.sums[groupby_column][y_column]
+
+        # Assign each month to its fiscal year, and keep those in range
+        months = self.first_month + np.arange(self.n_months)
+        fiscal_years = (months - (start_month - 1)) // 12 + 1970
+        is_kept = np.ones(self.n_months, dtype=bool)
+        if year_start is not None:
+            is_kept &= fiscal_years >= year_start
+        if year_end is not None:
+            is_kept &= fiscal_years <= year_end
+
+        # Reduce the months to the x values
+        if by_month:
+            x_name = 'Calendar Month'
+            x_codes, x_values = pd.factorize(months[is_kept] % 12 + 1, sort=True)
+            x_values = pd.to_datetime(
+                ['2000-{:02d}-01'.format(month) for month in x_values]
+            ).month_name()
+        else:
+            x_name = 'Reindexed Year'
+            x_codes, x_values = pd.factorize(fiscal_years[is_kept], sort=True)
+        per_x = np.zeros((len(x_values), table.shape[1]), dtype=table.dtype)
+        np.add.at(per_x, x_codes, table[is_kept])
+
+        # Reduce the values to the selected categories
+        tags = self.tags[groupby_column]
+        if selected_tags is None:
+            selected_tags = tags
+        selected_tags = sorted(set(selected_tags).intersection(tags))
+        tag_inds = [tags.index(tag) for tag in selected_tags]
+        value_has_tag = self.value_has_tag[groupby_column][:, tag_inds]
+        aggregated = per_x @ value_has_tag.astype(table.dtype)
+        totals = per_x[:, value_has_tag.any(axis=1)].sum(axis=1)
+        if aggregation_method == 'sum' and y_column in self.integer_columns:
+            aggregated = aggregated.astype(np.int64)
+            totals = totals.astype(np.int64)
+
+        index = pd.Index(x_values, name=x_name)
+        aggregated = pd.DataFrame(
+            aggregated,
+            index=index,
+            columns=pd.Index(selected_tags, name=groupby_column),
+        )
+        totals = pd.DataFrame({y_column: totals}, index=index)
+        total_by_instance = pd.DataFrame(
+            {'Aggregate': aggregated.to_numpy().sum(axis=0)},
+            index=aggregated.columns,
+        )
+        total_by_instance.sort_values(ascending=False, by='Aggregate', inplace=True)
+
+        return aggregated, totals, total_by_instance
@@ -15,7 +15,7 @@ import matplotlib.pyplot as plt
 import matplotlib.font_manager as font_manager
 import seaborn as sns
 
-from press_dash_lib import utils
+from press_dash_lib import indexes, utils
 
 from .settings import Settings
 
@@ -198,7 +198,6 @@ class Interface:
                 value=display_defaults.get(key, False),
                 key=tag + key
             )
-        '''
         key = 'recategorize'
         if key in ask_for:
             selected_settings[key] = st_loc.checkbox(
@@ -214,19 +213,20 @@ class Interface:
                         value=display_defaults.get(key, False),
                         key=tag + key
                     )
-        '''
         return selected_settings
 
     def process_filter_settings(
             self,
             st_loc,
             df: pd.DataFrame,
-            ask_for: list[str] = ['categorical', 'numerical'],
+            ask_for: list[str] = ['categorical', 'numerical', 'text'],
             local_key: str = None,
             display_defaults: dict = {},
             value: str = None,
             selected_settings: dict = None,
             tag: str = None,
+            bitmap_index: indexes.BitmapIndex = None,
+            sorted_index: indexes.SortedIndex = None,
     ) -> dict:
         '''Request common data settings from the user.
 
@@ -236,8 +236,13 @@ class Interface:
             ask_for: Keys for widgets to include.
             display_defaults: Default values the user sees in the widgets.
             display_options: Options the user sees in the widgets.
+            value: The multi-label column to filter on, e.g. 'Research Topics'.
             selected_settings: Where the settings should be stored. Defaults to common filter settings.
             tag: Unique tag that allows duplication of widgets.
+            bitmap_index: If the column is indexed, the options are taken from
+                the index instead of splitting up the column.
+            sorted_index: If the numerical and date columns are indexed,
+                the slider bounds are taken from the index.
 
         Returns:
             selected_settings: Current values in the dictionary the settings are stored in.
@@ -258,19 +263,16 @@ class Interface:
         else:
             tag += ':'
         
-        df_cpy = df.copy()
-        df_cpy[value] = df_cpy[value].str.split('|')
-        df_cpy = df_cpy.explode(value)
-        df_cpy[value] = df_cpy[value].str.strip()
-
-        if value in df_cpy.columns:
+        if value in df.columns:
             key = 'categorical'
             current = selected_settings.setdefault(key, {})
             key=tag + key
-            
-            
-            possible_columns = list(pd.unique(df_cpy[value], ))
-            
+
+            if bitmap_index is not None and value in bitmap_index.columns:
+                possible_columns = list(bitmap_index.tags[value])
+            else:
+                possible_columns = indexes.get_tags(df[value])
+
             # Check the current values then the passed-in defaults
             # for a default
             default = current.get(value, possible_columns)
@@ -282,8 +284,72 @@ class Interface:
                 key=tag + key + ':' + value
             )
 
-        temporary_dataset = df_cpy
-        return temporary_dataset, selected_settings
+        key = 'numerical'
+        if key in ask_for:
+            current = selected_settings.setdefault(key, {})
+            range_columns = [
+                _ for _ in self.config.get('numerical_columns', []) + self.config.get('date_columns', [])
+                if _ in df.columns
+            ]
+            for range_column in range_columns:
+                # The bounds come from the index when available, to avoid scanning the column
+                if sorted_index is not None and range_column in sorted_index.columns:
+                    bounds = sorted_index.get_bounds(range_column)
+                else:
+                    values = df[range_column].dropna()
+                    bounds = None if len(values) == 0 else (values.min(), values.max())
+                if bounds is None:
+                    continue
+
+                default = current.get(range_column)
+                default = display_defaults.get(key, {}).get(range_column, default)
+                if range_column in self.config.get('date_columns', []):
+                    min_value, max_value = [pd.Timestamp(_).date() for _ in bounds]
+                    if default is not None:
+                        default = tuple(pd.Timestamp(_).date() for _ in default)
+                    value_range = st_loc.date_input(
+                        '"{}" column: What range to include?'.format(range_column),
+                        value=(min_value, max_value) if default is None else default,
+                        min_value=min_value,
+                        max_value=max_value,
+                        key=tag + key + ':' + range_column,
+                    )
+                    # The range is incomplete while the user is picking it
+                    if len(value_range) != 2:
+                        continue
+                    # Stored as strings so the settings can be downloaded as json
+                    value_range = [_.isoformat() for _ in value_range]
+                    bounds = [min_value.isoformat(), max_value.isoformat()]
+                else:
+                    min_value, max_value = [float(_) for _ in bounds]
+                    if min_value == max_value:
+                        continue
+                    value_range = list(st_loc.slider(
+                        '"{}" column: What range to include?'.format(range_column),
+                        min_value,
+                        max_value,
+                        value=(min_value, max_value) if default is None else tuple(default),
+                        key=tag + key + ':' + range_column,
+                    ))
+                    bounds = [min_value, max_value]
+
+                # The full range isn't a filter, so entries missing a value stay included
+                if value_range == bounds:
+                    current.pop(range_column, None)
+                else:
+                    current[range_column] = value_range
+
+        key = 'text'
+        if key in ask_for:
+            text_columns = [_ for _ in self.config.get('text_columns', []) if _ in df.columns]
+            selected_settings[key] = st_loc.text_input(
+                'Search entries for (all terms must match):',
+                value=display_defaults.get(key, selected_settings.get(key, '')),
+                help='Searches the {} columns.'.format(', '.join(text_columns)),
+                key=tag + key,
+            )
+
+        return selected_settings
 
     def request_view_settings(
             self,
@@ -0,0 +1,158 @@
+'''Command for building the caches before the dashboard is first opened,
+e.g. as a deploy step. Prepares the data, which saves the prepped
+and shared data, then computes the most common views, which saves their
+aggregations when persist_results is set in the config.
+
+Usage: python -m press_dash_lib.prewarm [config_fp]
+'''
+import argparse
+import copy
+import glob
+import os
+import time
+import warnings
+
+from . import dash_builder, indexes
+
+
+def get_default_views(
+    config: dict,
+    bitmap_index: indexes.BitmapIndex,
+    min_year: int,
+    max_year: int,
+) -> list[dict]:
+    '''Get the most common views: the default view of each groupby column,
+    aggregation method, and column counted or summed, for every start month,
+    over the years the dashboard shows by default.
+
+    Args:
+        config: The config dict.
+        bitmap_index: The index of the groupings, for the groups selected by default.
+        min_year: The first calendar year in the data.
+        max_year: The last calendar year in the data.
+
+    Returns:
+        views: Arguments for DashBuilder.aggregate_view, excluding the data.
+            The first is the view the dashboard opens with.
+    '''
+    y_columns = {
+        'count': config['id_columns'],
+        'sum': config['numerical_columns'],
+    }
+    views = []
+    for groupby_column in config['groupings']:
+        # Matches the filters set by Interface.process_filter_settings,
+        # with every group selected and the full ranges not filtered
+        filters = {'categorical': {groupby_column: list(bitmap_index.tags[groupby_column])}}
+        for aggregation_method, method_y_columns in y_columns.items():
+            for y_column in method_y_columns:
+                for month_start in range(1, 13):
+                    # Matches the default range of the years slider
+                    year_start = min_year - 1 if month_start >= 9 else min_year
+                    views.append({
+                        'groupby_column': groupby_column,
+                        'y_column': y_column,
+                        'aggregation_method': aggregation_method,
+                        'filters': filters,
+                        'month_start': month_start,
+                        'year_start': year_start,
+                        'year_end': max_year,
+                    })
+
+    return views
+
+
+def check_prewarmed(config_fn: str, view: dict, user_utils=None) -> bool:
+    '''Check a view is served from the stored results, as it is for a new
+    dashboard process: it's requested with nothing in memory,
+    and nothing may be computed and stored.
+
+    Args:
+        config_fn: Path to the config file, relative to the working directory.
+        view: Arguments for DashBuilder.aggregate_view, excluding the data.
+        user_utils: User-customized module for data loading
+            and preprocessing. Defaults to the one in press_dash_lib.
+
+    Returns:
+        prewarmed: Whether or not the view was served from the stored results.
+    '''
+    builder = dash_builder.DashBuilder(config_fn, user_utils=user_utils)
+    data, _ = builder.build_data(copy.deepcopy(builder.config))
+    results_dir = os.path.join(builder.data_store.cache_dir, 'results')
+    stored = set(glob.glob(os.path.join(results_dir, '*.pkl')))
+    builder.aggregate_view(data['dataset'], **view)
+
+    return set(glob.glob(os.path.join(results_dir, '*.pkl'))) <= stored
+
+
+def prewarm(config_fp: str, user_utils=None) -> dash_builder.DashBuilder:
+    '''Prepare the data and compute the most common views, filling the disk caches.
+    Views the data cube answers aren't stored, since they don't need to be computed.
+
+    Args:
+        config_fp: Path to the config file.
+        user_utils: User-customized module for data loading
+            and preprocessing. Defaults to the one in press_dash_lib.
+
+    Returns:
+        builder: The builder used.
+    '''
+    # The config is loaded relative to its directory, as when running the dashboard
+    config_dir, config_fn = os.path.split(os.path.abspath(config_fp))
+    os.chdir(config_dir)
+
+    builder = dash_builder.DashBuilder(config_fn, user_utils=user_utils)
+    persist_results = builder.config.get('persist_results', False)
+    if not persist_results:
+        print('persist_results is not set in the config, so only the data is cached.')
+
+    start = time.perf_counter()
+    data, config = builder.build_data(copy.deepcopy(builder.config))
+    builder.config.update(config)
+    print('Prepped data in {:.1f} s'.format(time.perf_counter() - start))
+
+    source = data['dataset']
+    dates = data['preprocessed'][builder.config['date_columns'][0]]
+    views = [
+        view for view in get_default_views(
+            builder.config,
+            source.indexes['bitmaps'],
+            int(dates.dt.year.min()),
+            int(dates.dt.year.max()),
+        )
+        if not source.indexes['cube'].can_aggregate(
+            view['groupby_column'],
+            view['y_column'],
+            view['aggregation_method'],
+            view['filters'],
+        )
+    ]
+    start = time.perf_counter()
+    for view in views:
+        builder.aggregate_view(source, **view)
+    print('Computed {} views in {:.1f} s'.format(len(views), time.perf_counter() - start))
+
+    # One view is enough to check the stored results match what the dashboard requests
+    if persist_results and len(views) > 0:
+        if check_prewarmed(config_fn, views[0], user_utils=user_utils):
+            print('Prewarmed views are served from the stored results.')
+        else:
+            warnings.warn('Prewarmed views are not served from the stored results.')
+
+    return builder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        'config_fp',
+        nargs='?',
+        default='config.yml',
+        help='Path to the config file.',
+    )
+    args = parser.parse_args()
+    prewarm(args.config_fp)
+
+
+if __name__ == '__main__':
+    main()
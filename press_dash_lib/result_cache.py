@@ -0,0 +1,162 @@
+'''Module for caching intermediate results, e.g. filtered and aggregated data,
+in memory with a bounded size.
+'''
+import collections
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from . import dataset
+
+
+def get_nbytes(obj) -> int:
+    '''Estimate the memory used by a cached result.
+    Dataframes include the contents of object columns, e.g. strings.
+    Memory shared with the prepared data, e.g. indexes, isn't counted.
+
+    Args:
+        obj: The result, e.g. a dataframe or a tuple of them.
+
+    Returns:
+        nbytes: The estimated memory in bytes.
+    '''
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, dataset.Dataset):
+        return get_nbytes(obj.df)
+    if isinstance(obj, (tuple, list)):
+        return sys.getsizeof(obj) + sum(get_nbytes(item) for item in obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(get_nbytes(item) for item in obj.values())
+    return sys.getsizeof(obj)
+
+
+class ResultCache:
+    '''Class for an in-memory cache of results that stays within a byte budget.
+    It's a segmented LRU cache: new results go in a probationary segment,
+    and results used again are promoted to a protected segment, which takes
+    up to protected_fraction of the budget. Results only ever used once are
+    evicted first, so a burst of one-off requests doesn't push out the
+    frequently-used results. Safe to share between sessions, which run in
+    separate threads.
+
+    Args:
+        max_bytes: The byte budget. Results larger than this aren't cached.
+        protected_fraction: Fraction of the budget for results used more than once.
+    '''
+
+    def __init__(self, max_bytes: int, protected_fraction: float = 0.8):
+        self.max_bytes = max_bytes
+        self.max_protected_bytes = int(max_bytes * protected_fraction)
+        self.probation = collections.OrderedDict()
+        self.protected = collections.OrderedDict()
+        self.probation_bytes = 0
+        self.protected_bytes = 0
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        '''The memory used by the cached results.'''
+        return self.probation_bytes + self.protected_bytes
+
+    def __len__(self) -> int:
+        return len(self.probation) + len(self.protected)
+
+    def get(self, key, default=None):
+        '''Get a cached result, marking it as used.
+
+        Args:
+            key: Hashable key identifying the result.
+            default: Returned if the result isn't cached.
+
+        Returns:
+            result: The cached result, or default.
+        '''
+        with self.lock:
+            if key in self.protected:
+                self.protected.move_to_end(key)
+                return self.protected[key][0]
+            if key not in self.probation:
+                return default
+
+            # Used again, so it's promoted
+            result, nbytes = self.probation.pop(key)
+            self.probation_bytes -= nbytes
+            self.protected[key] = (result, nbytes)
+            self.protected_bytes += nbytes
+
+            # Demote the least-recently-used protected results to make room,
+            # giving them another chance before they're evicted
+            while self.protected_bytes > self.max_protected_bytes and len(self.protected) > 1:
+                demoted_key, (demoted, demoted_nbytes) = self.protected.popitem(last=False)
+                self.protected_bytes -= demoted_nbytes
+                self.probation[demoted_key] = (demoted, demoted_nbytes)
+                self.probation_bytes += demoted_nbytes
+            self.evict()
+
+            return result
+
+    def put(self, key, result):
+        '''Cache a result, evicting others as needed to stay within the budget.
+
+        Args:
+            key: Hashable key identifying the result.
+            result: The result.
+        '''
+        nbytes = get_nbytes(result)
+        with self.lock:
+            self.discard(key)
+            if nbytes > self.max_bytes:
+                return
+            self.probation[key] = (result, nbytes)
+            self.probation_bytes += nbytes
+            self.evict()
+
+    def get_or_compute(self, key, compute_fn):
+        '''Get a cached result, computing and caching it if it isn't cached.
+        Results are shared, so they must not be modified.
+
+        Args:
+            key: Hashable key identifying the result.
+            compute_fn: Function that accepts no arguments and returns the result.
+
+        Returns:
+            result: The result.
+        '''
+        # Results can be None, so a unique object marks a miss
+        missing = object()
+        result = self.get(key, missing)
+        if result is missing:
+            result = compute_fn()
+            self.put(key, result)
+
+        return result
+
+    def discard(self, key):
+        '''Remove a result if it's cached. The lock must be held.
+
+        Args:
+            key: Hashable key identifying the result.
+        '''
+        if key in self.probation:
+            self.probation_bytes -= self.probation.pop(key)[1]
+        elif key in self.protected:
+            self.protected_bytes -= self.protected.pop(key)[1]
+
+    def evict(self):
+        '''Evict results until the cache is within the budget, least-recently-used
+        probationary results first. The lock must be held.
+        '''
+        while self.nbytes > self.max_bytes:
+            segment = self.probation if len(self.probation) > 0 else self.protected
+            _, (_, nbytes) = segment.popitem(last=False)
+            if segment is self.probation:
+                self.probation_bytes -= nbytes
+            else:
+                self.protected_bytes -= nbytes
@@ -0,0 +1,766 @@
+'''Module for persisting data on disk, so that restarting the dashboard
+does not require rerunning the full data pipeline.
+'''
+import glob
+import hashlib
+import inspect
+import json
+import mmap
+import os
+import pickle
+import shutil
+import tempfile
+import warnings
+from typing import Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import yaml
+
+from . import utils
+
+# How many prepared versions of the data to keep on disk
+N_KEPT_VERSIONS = 3
+
+# Byte alignment of the arrays in shared files, so they can be used in place
+BUFFER_ALIGNMENT = 64
+
+# How many computed results to keep on disk, across all versions of the data
+N_KEPT_RESULTS = 1000
+
+# Version of how data is stored on disk. Changing it invalidates everything stored
+CACHE_FORMAT_VERSION = 1
+
+
+def fingerprint_file(fp: str, block_size: int = 2**20) -> dict:
+    '''Identify the state of a file by its path, size, modification time,
+    and a hash of its content.
+
+    Args:
+        fp: Filepath of the file.
+        block_size: Number of bytes read at a time while hashing.
+
+    Returns:
+        fingerprint: The path, size, mtime, and content hash of the file.
+    '''
+    stat = os.stat(fp)
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(fp, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            hasher.update(block)
+
+    return {
+        'path': os.path.abspath(fp),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'hash': hasher.hexdigest(),
+    }
+
+
+def hash_object(obj) -> str:
+    '''Hash a json-serializable object, e.g. the config.
+    Keys are sorted so the hash doesn't depend on insertion order.
+
+    Args:
+        obj: The object to hash.
+
+    Returns:
+        hash: Hex digest of the object.
+    '''
+    obj_str = json.dumps(obj, sort_keys=True, default=str)
+    return hashlib.blake2b(obj_str.encode('UTF-8'), digest_size=16).hexdigest()
+
+
+def hash_code(modules: list) -> str:
+    '''Hash the source code of modules, so what's stored on disk can be keyed
+    by the code that computed it, e.g. pickled instances of classes defined in it.
+    Only the content is hashed, so reinstalling the same code changes nothing.
+
+    Args:
+        modules: The modules.
+
+    Returns:
+        hash: Hex digest of the source code and CACHE_FORMAT_VERSION.
+    '''
+    hasher = hashlib.blake2b(str(CACHE_FORMAT_VERSION).encode('UTF-8'), digest_size=16)
+    for module in modules:
+        with open(inspect.getsourcefile(module), 'rb') as file:
+            hasher.update(file.read())
+
+    return hasher.hexdigest()
+
+
+def to_storable(df: pd.DataFrame) -> pd.DataFrame:
+    '''Convert a dataframe into a form that can be stored in a columnar format.
+    Columnar formats require one type per column, so object columns
+    with mixed types (e.g. strings and floats) are converted to strings.
+    DataHandler converts the data it builds the same way, so this only
+    changes data that isn't built by it, e.g. a user's raw files.
+
+    Args:
+        df: The dataframe to convert.
+
+    Returns:
+        storable_df: The converted dataframe. The original is not modified.
+    '''
+    return utils.stringify_mixed_columns(df)
+
+
+def widen_schema(schema: pa.Schema) -> pa.Schema:
+    '''Widen the integer types in a schema to 64 bits, including the
+    indices of dictionary (categorical) types. Used when data arrives in
+    chunks, since a compact type chosen for one chunk may not fit the next.
+
+    Args:
+        schema: The schema to widen.
+
+    Returns:
+        widened: The widened schema, with the same metadata.
+    '''
+    fields = []
+    for field in schema:
+        if pa.types.is_integer(field.type):
+            field = field.with_type(pa.int64())
+        elif pa.types.is_dictionary(field.type):
+            field = field.with_type(pa.dictionary(pa.int64(), field.type.value_type))
+        fields.append(field)
+
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+def dump_with_buffers(obj, fp: str) -> list[list[int]]:
+    '''Pickle an object, e.g. the indexes, with its arrays written separately
+    to a file of raw buffers, so they can be loaded memory-mapped.
+
+    Args:
+        obj: The object to pickle.
+        fp: Filepath for the pickle. The buffers go in fp + '.buffers'.
+
+    Returns:
+        spans: (offset, size) of each buffer in the buffers file.
+    '''
+    buffers = []
+    with open(fp, 'wb') as file:
+        pickle.dump(obj, file, protocol=5, buffer_callback=buffers.append)
+
+    spans = []
+    with open(fp + '.buffers', 'wb') as file:
+        for buffer in buffers:
+            raw = buffer.raw()
+            file.write(b'\0' * (-file.tell() % BUFFER_ALIGNMENT))
+            spans.append([file.tell(), raw.nbytes])
+            file.write(raw)
+
+    return spans
+
+
+def load_with_buffers(fp: str, spans: list[list[int]]):
+    '''Load an object pickled by dump_with_buffers. Its arrays are read-only views
+    of the memory-mapped buffers file, so processes loading the same file
+    share one copy of them in the OS page cache.
+
+    Args:
+        fp: Filepath of the pickle.
+        spans: (offset, size) of each buffer in the buffers file.
+
+    Returns:
+        obj: The unpickled object.
+    '''
+    buffers = []
+    if len(spans) > 0:
+        with open(fp + '.buffers', 'rb') as file:
+            mapped = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        buffers = [mapped[offset:offset + size] for offset, size in spans]
+    with open(fp, 'rb') as file:
+        return pickle.load(file, buffers=buffers)
+
+
+class DataStore:
+    '''Class for storing prepared data on disk as parquet files.
+    Each version of the data lives in its own directory, named by a key
+    built from everything the data depends on. When the sources change
+    the key changes, so stale versions are never loaded.
+
+    Args:
+        config: The config dictionary.
+    '''
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.cache_dir = os.path.join(
+            config['data_dir'],
+            config.get('cache_dirname', 'cache'),
+        )
+        self.enabled = config.get('use_disk_cache', True)
+        self.share = config.get('share_prepped_data', True)
+        self.persist_results = config.get('persist_results', False)
+
+    def get_key(self, source_fps: list[str], config: dict, code_version: str = None) -> str:
+        '''Get the key identifying a version of the prepared data.
+
+        Args:
+            source_fps: Filepaths of the files the data depends on,
+                including the code run on them, e.g. user_utils.py.
+            config: The config dict used to prepare the data.
+            code_version: Identifies the library code the data depends on,
+                e.g. from hash_code.
+
+        Returns:
+            key: Hash of the source fingerprints, the config, and the code version.
+        '''
+        fingerprints = [fingerprint_file(fp) for fp in sorted(set(source_fps))]
+        return hash_object([fingerprints, config, CACHE_FORMAT_VERSION, code_version])
+
+    def load_prepped(self, key: str, force: bool = False, data_keys: list[str] = None) -> Tuple[dict, dict]:
+        '''Load a prepared version of the data, if it exists.
+
+        Args:
+            key: Key identifying the version of the data.
+            force: Load even if the disk cache is turned off, e.g. for
+                streamed data, which is always written to disk.
+            data_keys: Which dataframes to load, if they were saved. Defaults to all.
+
+        Returns:
+            data: Dict of dataframes, or None if not available.
+            config: The config the data was prepped with, or None if not available.
+        '''
+        key_dir = os.path.join(self.cache_dir, 'prep', key)
+        if not (self.enabled or force) or not os.path.isdir(key_dir):
+            return None, None
+
+        with open(os.path.join(key_dir, 'manifest.json'), 'r', encoding='UTF-8') as file:
+            manifest = json.load(file)
+        data = {}
+        for data_key in manifest['data_keys']:
+            if data_keys is not None and data_key not in data_keys:
+                continue
+            data[data_key] = pd.read_parquet(os.path.join(key_dir, data_key + '.parquet'))
+        with open(os.path.join(key_dir, 'config.yml'), 'r', encoding='UTF-8') as file:
+            config = yaml.load(file, Loader=yaml.FullLoader)
+
+        # Mark as recently used, so it's not pruned
+        os.utime(key_dir)
+
+        return data, config
+
+    def save_prepped(self, key: str, data: dict, config: dict) -> bool:
+        '''Save a prepared version of the data.
+        The data is written to a temporary directory that is then moved into
+        place, so a partially-written version is never loaded.
+
+        Args:
+            key: Key identifying the version of the data.
+            data: Dict of dataframes to save.
+            config: The config the data was prepped with.
+
+        Returns:
+            saved: Whether or not the data was saved.
+        '''
+        if not self.enabled:
+            return False
+
+        prep_dir = os.path.join(self.cache_dir, 'prep')
+        key_dir = os.path.join(prep_dir, key)
+        if os.path.isdir(key_dir):
+            # Another process got here first
+            return True
+        os.makedirs(prep_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=prep_dir, prefix='.tmp')
+        try:
+            for data_key, df in data.items():
+                df = to_storable(df)
+                df.to_parquet(os.path.join(tmp_dir, data_key + '.parquet'))
+            with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='UTF-8') as file:
+                json.dump({'data_keys': list(data.keys())}, file)
+            with open(os.path.join(tmp_dir, 'config.yml'), 'w', encoding='UTF-8') as file:
+                yaml.dump(config, file)
+            os.replace(tmp_dir, key_dir)
+        except (pa.ArrowException, OSError, TypeError, ValueError) as e:
+            # Failing to cache shouldn't stop the dashboard from running
+            warnings.warn('Could not cache the prepared data: {}'.format(e))
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+
+        self.prune(os.path.join(prep_dir, '*'))
+
+        return True
+
+    def save_prepped_chunks(self, key: str, data_key: str, chunks) -> dict:
+        '''Save a prepared version of the data that arrives in chunks,
+        writing each chunk to disk as it arrives. Only one chunk is held
+        in memory at a time. Unlike save_prepped, this always writes to disk,
+        because the disk is where the chunks are combined.
+        Integers are stored at full width, so compact types should be
+        reapplied after loading.
+
+        Args:
+            key: Key identifying the version of the data.
+            data_key: Name the data is saved under, e.g. 'preprocessed'.
+            chunks: Iterable of (dataframe, config) pairs.
+                Each dataframe must have the same columns.
+
+        Returns:
+            config: The config returned with the last chunk.
+        '''
+        prep_dir = os.path.join(self.cache_dir, 'prep')
+        key_dir = os.path.join(prep_dir, key)
+        os.makedirs(prep_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=prep_dir, prefix='.tmp')
+        writer = None
+        try:
+            for df, config in chunks:
+                table = pa.Table.from_pandas(to_storable(df), preserve_index=True)
+                if writer is None:
+                    writer = pq.ParquetWriter(
+                        os.path.join(tmp_dir, data_key + '.parquet'),
+                        widen_schema(table.schema),
+                    )
+                # Types inferred per chunk can differ, e.g. a chunk with no
+                # missing values. The first chunk sets the types.
+                table = table.cast(writer.schema)
+                writer.write_table(table)
+            if writer is None:
+                raise ValueError('No data was found to stream.')
+            writer.close()
+            with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='UTF-8') as file:
+                json.dump({'data_keys': [data_key,]}, file)
+            with open(os.path.join(tmp_dir, 'config.yml'), 'w', encoding='UTF-8') as file:
+                yaml.dump(config, file)
+            if os.path.isdir(key_dir):
+                shutil.rmtree(tmp_dir)
+            else:
+                os.replace(tmp_dir, key_dir)
+        except BaseException:
+            if writer is not None:
+                writer.close()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        self.prune(os.path.join(prep_dir, '*'))
+
+        return config
+
+    def load_shared(self, key: str) -> Tuple[dict, dict]:
+        '''Load the final preprocessed data and its indexes memory-mapped,
+        if they've been saved with save_shared. Every process loading the same
+        version shares one copy in the OS page cache, and nothing needs to be
+        recomputed. Columns that pandas stores as python objects are still copied.
+
+        Args:
+            key: Key identifying the version of the data.
+
+        Returns:
+            data: Dict containing the preprocessed data and its indexes,
+                or None if not available.
+            config: The config the data was prepped with, or None if not available.
+        '''
+        key_dir = os.path.join(self.cache_dir, 'shared', key)
+        if not (self.enabled and self.share) or not os.path.isdir(key_dir):
+            return None, None
+
+        with open(os.path.join(key_dir, 'manifest.json'), 'r', encoding='UTF-8') as file:
+            manifest = json.load(file)
+        # The table keeps the memory map open for as long as it's used
+        source = pa.memory_map(os.path.join(key_dir, 'preprocessed.arrow'), 'r')
+        table = pa.ipc.open_file(source).read_all()
+        data = {
+            # Split blocks lets numerical columns without missing values
+            # stay views of the memory-mapped file
+            'preprocessed': table.to_pandas(split_blocks=True),
+            'indexes': load_with_buffers(
+                os.path.join(key_dir, 'indexes.pkl'),
+                manifest['index_buffers'],
+            ),
+        }
+        with open(os.path.join(key_dir, 'config.yml'), 'r', encoding='UTF-8') as file:
+            config = yaml.load(file, Loader=yaml.FullLoader)
+
+        # Mark as recently used, so it's not pruned
+        os.utime(key_dir)
+
+        return data, config
+
+    def save_shared(self, key: str, preprocessed_df: pd.DataFrame, data_indexes: dict, config: dict) -> bool:
+        '''Save the final preprocessed data and its indexes in a form
+        that can be memory-mapped, for load_shared. The data is an uncompressed
+        Arrow IPC (Feather) file, and the arrays in the indexes are stored raw.
+
+        Args:
+            key: Key identifying the version of the data.
+            preprocessed_df: The preprocessed data, including any columns added after prepping.
+            data_indexes: The indexes of the preprocessed data, including the pair tables
+                that explode the groupings.
+            config: The config the data was prepped with.
+
+        Returns:
+            saved: Whether or not the data was saved.
+        '''
+        if not (self.enabled and self.share):
+            return False
+
+        shared_dir = os.path.join(self.cache_dir, 'shared')
+        key_dir = os.path.join(shared_dir, key)
+        if os.path.isdir(key_dir):
+            # Another process got here first
+            return True
+        os.makedirs(shared_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=shared_dir, prefix='.tmp')
+        try:
+            table = pa.Table.from_pandas(to_storable(preprocessed_df), preserve_index=True)
+            with pa.OSFile(os.path.join(tmp_dir, 'preprocessed.arrow'), 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            index_buffers = dump_with_buffers(
+                data_indexes,
+                os.path.join(tmp_dir, 'indexes.pkl'),
+            )
+            with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='UTF-8') as file:
+                json.dump({'index_buffers': index_buffers}, file)
+            with open(os.path.join(tmp_dir, 'config.yml'), 'w', encoding='UTF-8') as file:
+                yaml.dump(config, file)
+            os.replace(tmp_dir, key_dir)
+        except (pa.ArrowException, OSError, TypeError, ValueError, pickle.PicklingError) as e:
+            # Failing to cache shouldn't stop the dashboard from running
+            warnings.warn('Could not save the shared data: {}'.format(e))
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+
+        self.prune(os.path.join(shared_dir, '*'))
+
+        return True
+
+    def load_result(self, key: str, compute_fn):
+        '''Load a computed result, e.g. an aggregation, computing and saving it
+        if it isn't stored. Every process using the same cache directory reads
+        and writes the same results, so each is computed once per version of the data.
+        The least-recently-used results beyond N_KEPT_RESULTS are removed.
+
+        Args:
+            key: Hash identifying the result, including the version of the data
+                it was computed from and the parameters used.
+            compute_fn: Function that accepts no arguments and returns the result.
+                The result must be picklable.
+
+        Returns:
+            result: The result.
+        '''
+        if not (self.enabled and self.persist_results):
+            return compute_fn()
+
+        results_dir = os.path.join(self.cache_dir, 'results')
+        result_fp = os.path.join(results_dir, key + '.pkl')
+        try:
+            with open(result_fp, 'rb') as file:
+                result = pickle.load(file)
+            # Mark as recently used, so it's not pruned
+            os.utime(result_fp)
+            return result
+        except FileNotFoundError:
+            pass
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            warnings.warn('Could not load the cached result: {}'.format(e))
+
+        result = compute_fn()
+        tmp_fp = None
+        try:
+            os.makedirs(results_dir, exist_ok=True)
+            # Unique temporary files, since other processes may be saving the same result
+            fd, tmp_fp = tempfile.mkstemp(dir=results_dir, prefix='.tmp')
+            with os.fdopen(fd, 'wb') as file:
+                pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_fp, result_fp)
+        except (OSError, TypeError, pickle.PicklingError) as e:
+            # Failing to cache shouldn't stop the dashboard from running
+            warnings.warn('Could not cache the result: {}'.format(e))
+            if tmp_fp is not None and os.path.isfile(tmp_fp):
+                os.remove(tmp_fp)
+            return result
+
+        self.prune(os.path.join(results_dir, '*.pkl'), n_kept=N_KEPT_RESULTS)
+
+        return result
+
+    def load_converted(self, fp: str, read_fn) -> pd.DataFrame:
+        '''Load a file that's slow to parse, e.g. an Excel workbook, from a
+        parquet copy. The file is only parsed the first time it's seen,
+        or after it changes. Changes are detected using the size and mtime,
+        so checking the copy doesn't require reading the file.
+
+        Args:
+            fp: Filepath of the file.
+            read_fn: Function that accepts a filepath and returns a dataframe.
+
+        Returns:
+            df: The data in the file.
+        '''
+        if not self.enabled:
+            return read_fn(fp)
+
+        stat = os.stat(fp)
+        key = hash_object([os.path.abspath(fp), stat.st_size, stat.st_mtime_ns])
+        converted_dir = os.path.join(self.cache_dir, 'converted')
+        converted_fp = os.path.join(
+            converted_dir,
+            '{}.{}.parquet'.format(os.path.basename(fp), key),
+        )
+        if os.path.isfile(converted_fp):
+            return pd.read_parquet(converted_fp)
+
+        df = to_storable(read_fn(fp))
+        os.makedirs(converted_dir, exist_ok=True)
+        tmp_fp = converted_fp + '.tmp'
+        df.to_parquet(tmp_fp)
+        os.replace(tmp_fp, converted_fp)
+        self.prune(os.path.join(converted_dir, os.path.basename(fp) + '.*.parquet'))
+
+        return df
+
+    def load_column(self, version: str, column_key: str, compute_fn) -> pd.Series:
+        '''Load a column derived from a version of the prepared data,
+        e.g. recategorized categories, computing and saving it if it isn't stored.
+        Columns are kept only for the most-recent versions of the data.
+
+        Args:
+            version: Key identifying the version of the prepared data.
+            column_key: Key identifying how the column is derived from the data,
+                e.g. a hash of the rules used to compute it.
+            compute_fn: Function that accepts no arguments and returns the column.
+
+        Returns:
+            column: The column.
+        '''
+        if not self.enabled:
+            return compute_fn()
+
+        columns_dir = os.path.join(self.cache_dir, 'columns')
+        version_dir = os.path.join(columns_dir, version)
+        column_fp = os.path.join(version_dir, column_key + '.parquet')
+        if os.path.isfile(column_fp):
+            column_df = pd.read_parquet(column_fp)
+            # Mark as recently used, so it's not pruned
+            os.utime(version_dir)
+            return column_df.iloc[:, 0]
+
+        column = compute_fn()
+        try:
+            os.makedirs(version_dir, exist_ok=True)
+            tmp_fp = column_fp + '.tmp'
+            to_storable(column.to_frame()).to_parquet(tmp_fp)
+            os.replace(tmp_fp, column_fp)
+        except (pa.ArrowException, OSError, TypeError, ValueError) as e:
+            # Failing to cache shouldn't stop the dashboard from running
+            warnings.warn('Could not cache the column: {}'.format(e))
+            return column
+
+        # Mark as recently used, so it's not pruned
+        os.utime(version_dir)
+        self.prune(os.path.join(columns_dir, '*'))
+
+        return column
+
+    def prune(self, pattern: str, n_kept: int = N_KEPT_VERSIONS):
+        '''Remove all but the most-recent versions matching a pattern.
+
+        Args:
+            pattern: Glob pattern for the cached versions.
+            n_kept: How many versions to keep.
+        '''
+        # Other processes can prune at the same time, so files may disappear
+        mtimes = {}
+        for fp in glob.glob(pattern):
+            try:
+                mtimes[fp] = os.path.getmtime(fp)
+            except FileNotFoundError:
+                continue
+        fps = sorted(mtimes, key=mtimes.get, reverse=True)
+        for fp in fps[n_kept:]:
+            if os.path.isdir(fp):
+                shutil.rmtree(fp, ignore_errors=True)
+            else:
+                try:
+                    os.remove(fp)
+                except FileNotFoundError:
+                    continue
+
+
+class SnapshotStore:
+    '''Class for merging many snapshots of the same data into one store.
+    Each row is identified by an id, and when the same id shows up in
+    multiple snapshots the row from the newest snapshot is kept.
+    The store remembers which files it has ingested, so files that are new
+    are read and merged in. If an ingested file changes or is removed,
+    or the snapshots are read differently, the store is rebuilt from
+    all the current snapshots. If the disk cache is turned off,
+    every snapshot is read each time and nothing is written.
+
+    Args:
+        config: The config dictionary.
+        name: Name of the store, used for the directory it's kept in.
+    '''
+
+    def __init__(self, config: dict, name: str = 'snapshots'):
+        self.config = config
+        self.enabled = config.get('use_disk_cache', True)
+        self.store_dir = os.path.join(
+            config['data_dir'],
+            config.get('cache_dirname', 'cache'),
+            name,
+        )
+        self.data_fp = os.path.join(self.store_dir, 'merged.parquet')
+        self.manifest_fp = os.path.join(self.store_dir, 'manifest.json')
+
+    def load_manifest(self, reader_version: str = None) -> dict:
+        '''Load the record of which files have been ingested.
+
+        Args:
+            reader_version: Identifies how the snapshots are read.
+                Files ingested by other versions aren't counted as ingested.
+
+        Returns:
+            manifest: Dict of file fingerprints, keyed by filepath.
+        '''
+        if not (os.path.isfile(self.manifest_fp) and os.path.isfile(self.data_fp)):
+            return {}
+        with open(self.manifest_fp, 'r', encoding='UTF-8') as file:
+            manifest = json.load(file)
+        version = [CACHE_FORMAT_VERSION, reader_version]
+        if manifest.get('version') != version:
+            return {}
+
+        return manifest['files']
+
+    def save_manifest(self, manifest: dict, reader_version: str = None):
+        '''Save the record of which files have been ingested.
+
+        Args:
+            manifest: Dict of file fingerprints, keyed by filepath.
+            reader_version: Identifies how the snapshots were read.
+        '''
+        def write_fn(fp):
+            with open(fp, 'w', encoding='UTF-8') as file:
+                json.dump({'version': [CACHE_FORMAT_VERSION, reader_version], 'files': manifest}, file)
+
+        self.write_atomic(write_fn, self.manifest_fp)
+
+    def write_atomic(self, write_fn, fp: str):
+        '''Write a file by writing a unique temporary file and moving it into place,
+        so other processes, which may be writing the same file, never see it partially written.
+
+        Args:
+            write_fn: Function that accepts a filepath and writes the file there.
+            fp: Filepath to write.
+        '''
+        os.makedirs(self.store_dir, exist_ok=True)
+        fd, tmp_fp = tempfile.mkstemp(dir=self.store_dir, prefix='.tmp')
+        os.close(fd)
+        try:
+            write_fn(tmp_fp)
+            os.replace(tmp_fp, fp)
+        finally:
+            if os.path.isfile(tmp_fp):
+                os.remove(tmp_fp)
+
+    def get_changed_fps(self, fps: list[str], manifest: dict) -> Tuple[list[str], dict]:
+        '''Find the files that are new or have changed since they were ingested.
+        Files whose size and mtime are unchanged are skipped without hashing.
+
+        Args:
+            fps: Filepaths of all the snapshots.
+            manifest: Dict of file fingerprints, keyed by filepath.
+
+        Returns:
+            changed_fps: Filepaths that need to be ingested.
+            manifest: The manifest, updated for files that were touched
+                but not changed.
+        '''
+        changed_fps = []
+        for fp in fps:
+            abs_fp = os.path.abspath(fp)
+            recorded = manifest.get(abs_fp)
+            stat = os.stat(fp)
+            if (
+                recorded is not None
+                and recorded['size'] == stat.st_size
+                and recorded['mtime'] == stat.st_mtime_ns
+            ):
+                continue
+            fingerprint = fingerprint_file(fp)
+            if recorded is not None and recorded['hash'] == fingerprint['hash']:
+                manifest[abs_fp].update(fingerprint)
+                continue
+            changed_fps.append(fp)
+
+        return changed_fps, manifest
+
+    def ingest(
+        self,
+        fps: list[str],
+        read_fn,
+        id_column: str = 'id',
+        reader_version: str = None,
+    ) -> pd.DataFrame:
+        '''Merge the snapshots into the store and return the merged data.
+        Snapshots are ordered by creation time, the same way the most-recent
+        file is chosen when only one snapshot is used.
+
+        Args:
+            fps: Filepaths of all the snapshots.
+            read_fn: Function that accepts a filepath and returns a dataframe
+                indexed by id_column.
+            id_column: Name of the index identifying each row.
+            reader_version: Identifies how read_fn reads the snapshots, e.g. a hash
+                of its code and the dtypes it parses. When it changes, every
+                snapshot is read again.
+
+        Returns:
+            merged_df: One row per id, from the newest snapshot containing it.
+        '''
+        manifest = self.load_manifest(reader_version) if self.enabled else {}
+        changed_fps, manifest = self.get_changed_fps(fps, manifest)
+
+        # Rows from snapshots that changed or are gone may have replaced older rows
+        # that weren't kept, so the store is rebuilt from the current snapshots.
+        # Only new snapshots are merged into the store
+        current_fps = set(os.path.abspath(fp) for fp in fps)
+        if (
+            len(set(manifest.keys()) - current_fps) > 0
+            or any(os.path.abspath(fp) in manifest for fp in changed_fps)
+        ):
+            manifest = {}
+            changed_fps = list(fps)
+
+        if len(manifest) > 0:
+            merged_df = pd.read_parquet(self.data_fp)
+        else:
+            merged_df = None
+        if len(changed_fps) == 0:
+            if merged_df is None:
+                raise ValueError('No snapshots were found to ingest.')
+            return merged_df.drop(columns='snapshot_time')
+
+        # Read only what's new, and mark each row with its snapshot's age
+        new_dfs = []
+        for fp in changed_fps:
+            snapshot_df = read_fn(fp)
+            snapshot_df['snapshot_time'] = os.path.getctime(fp)
+            new_dfs.append(snapshot_df)
+            manifest[os.path.abspath(fp)] = fingerprint_file(fp)
+        if merged_df is not None:
+            new_dfs.insert(0, merged_df)
+        merged_df = pd.concat(new_dfs)
+
+        # The sort is stable, so ties are broken in favor of newly-read data
+        merged_df = merged_df.sort_values('snapshot_time', kind='stable')
+        merged_df = merged_df.loc[~merged_df.index.duplicated(keep='last')]
+        merged_df.index.name = id_column
+        merged_df = to_storable(merged_df)
+        if not self.enabled:
+            return merged_df.drop(columns='snapshot_time')
+
+        # Save the merged data before the manifest, so the manifest never
+        # claims a file was ingested when it wasn't
+        self.write_atomic(merged_df.to_parquet, self.data_fp)
+        self.save_manifest(manifest, reader_version)
+
+        return merged_df.drop(columns='snapshot_time')
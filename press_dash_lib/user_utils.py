@@ -3,11 +3,138 @@ the user's data. If you are adapting the dashboard as your own,
 you likely need to alter these functions.
 '''
 import os
+import sys
 import glob
 import numpy as np
 import pandas as pd
 
-from press_dash_lib import utils
+from press_dash_lib import utils, store
+
+
+def get_fp_of_most_recent_file(pattern):
+    '''Get the filepath of the most-recently created file matching
+    the pattern.
+
+    Args:
+        pattern (str): The pattern to match.
+
+    Returns:
+        fp (str): The filepath of the most-recently created file
+            matching the pattern.
+    '''
+    fps = glob.glob(pattern)
+    ind_selected = np.argmax([os.path.getctime(_) for _ in fps])
+    return fps[ind_selected]
+
+
+def get_source_fps(config):
+    '''Modify this if you change what files load_data reads!
+
+    Get the filepaths of the data files used by load_data.
+    The prepared data is cached on disk, and these files are checked
+    to decide if the cache is still valid.
+
+    Args:
+        config (dict): The configuration dictionary, loaded from a YAML file.
+
+    Returns:
+        source_fps (dict): The filepaths of the data files, by data source.
+    '''
+    input_dir = os.path.join(config['data_dir'], config['input_dirname'])
+
+    data_pattern = os.path.join(input_dir, config['website_data_file_pattern'])
+    press_office_pattern = os.path.join(
+        input_dir, config['press_office_data_file_pattern']
+    )
+
+    source_fps = {
+        'website': get_fp_of_most_recent_file(data_pattern),
+        'press_office': get_fp_of_most_recent_file(press_office_pattern),
+    }
+
+    # When merging snapshots we use every matching file
+    if config.get('ingestion_mode', 'most_recent') == 'snapshots':
+        snapshot_pattern = os.path.join(input_dir, config['snapshot_file_pattern'])
+        source_fps['website'] = sorted(glob.glob(snapshot_pattern))
+
+    return source_fps
+
+
+def read_website_data(data_fp, config):
+    '''Modify this if the format of the website data changes!
+
+    Read a single file of website data.
+
+    Args:
+        data_fp (str): The filepath of the website data.
+        config (dict): The configuration dictionary, loaded from a YAML file.
+
+    Returns:
+        website_df (pandas.DataFrame): The website data, indexed by id.
+    '''
+    website_df = pd.read_csv(
+        data_fp,
+        parse_dates=['Date',],
+        dtype=utils.get_parse_dtypes(config),
+        encoding_errors='ignore',
+    )
+    website_df.set_index('id', inplace=True)
+
+    return website_df
+
+
+def read_press_office_data(press_office_data_fp, config):
+    '''Modify this if the format of the press office data changes!
+
+    Read the press office workbook.
+
+    Args:
+        press_office_data_fp (str): The filepath of the press office data.
+        config (dict): The configuration dictionary, loaded from a YAML file.
+
+    Returns:
+        press_df (pandas.DataFrame): The press office data, indexed by id.
+    '''
+    press_df = pd.read_excel(
+        press_office_data_fp,
+        dtype=utils.get_parse_dtypes(config),
+    )
+    press_df.set_index('id', inplace=True)
+
+    return press_df
+
+
+def join_press_office_data(website_df, press_office_data_fp, config):
+    '''Modify this if you change how the two data sources are combined!
+
+    Add the press office data to the website data.
+
+    Args:
+        website_df (pandas.DataFrame): The website data, indexed by id.
+        press_office_data_fp (str): The filepath of the press office data.
+        config (dict): The configuration dictionary, loaded from a YAML file.
+
+    Returns:
+        joined_df (pandas.DataFrame): The combined data, indexed by id.
+    '''
+    # Parsing Excel is slow, so the workbook is converted once
+    # and read from the converted copy until it changes
+    press_df = store.DataStore(config).load_converted(
+        press_office_data_fp,
+        lambda fp: read_press_office_data(fp, config),
+    )
+
+    # Join on integer ids. Where both sources have a value
+    # the press office value is used.
+    website_df.index = website_df.index.astype('int64')
+    press_df.index = press_df.index.astype('int64')
+    press_df = press_df.reindex(website_df.index)
+    shared_columns = website_df.columns.intersection(press_df.columns)
+    for column in shared_columns:
+        website_df[column] = press_df[column].fillna(website_df[column])
+    joined_df = website_df.join(press_df.drop(columns=shared_columns))
+
+    return joined_df
 
 
 def load_data(config):
@@ -31,47 +158,77 @@ def load_data(config):
     ##########################################################################
     # Filepaths
 
-    input_dir = os.path.join(config['data_dir'], config['input_dirname'])
-
-    def get_fp_of_most_recent_file(pattern):
-        '''Get the filepath of the most-recently created file matching
-        the pattern. We just define this here because we use it twice.
-
-        Args:
-            pattern (str): The pattern to match.
-
-        Returns:
-            fp (str): The filepath of the most-recently created file
-                matching the pattern.
-        '''
-        fps = glob.glob(pattern)
-        ind_selected = np.argmax([os.path.getctime(_) for _ in fps])
-        return fps[ind_selected]
-
-    data_pattern = os.path.join(input_dir, config['website_data_file_pattern'])
-    data_fp = get_fp_of_most_recent_file(data_pattern)
-
-    press_office_pattern = os.path.join(
-        input_dir, config['press_office_data_file_pattern']
-    )
-    press_office_data_fp = get_fp_of_most_recent_file(press_office_pattern)
+    source_fps = get_source_fps(config)
+    press_office_data_fp = source_fps['press_office']
 
     ##########################################################################
     # Load data
 
     # Website data
-    website_df = pd.read_csv(data_fp, parse_dates=['Date',], encoding_errors='ignore')
-    website_df.set_index('id', inplace=True)
+    if config.get('ingestion_mode', 'most_recent') == 'snapshots':
+        # Merge all snapshots, keeping the newest version of each article.
+        # Only snapshots that are new since the last load are read,
+        # unless this code or the column types it reads change.
+        snapshot_store = store.SnapshotStore(config)
+        website_df = snapshot_store.ingest(
+            source_fps['website'],
+            lambda data_fp: read_website_data(data_fp, config),
+            reader_version=store.hash_object([
+                store.hash_code([sys.modules[__name__]]),
+                utils.get_parse_dtypes(config),
+            ]),
+        )
+    else:
+        website_df = read_website_data(source_fps['website'], config)
+
+    # Press office data
+    if config.get('include_press_office', False):
+        raw_df = join_press_office_data(website_df, press_office_data_fp, config)
+    else:
+        raw_df = website_df
 
-    # if not combined
-    #press_df = pd.read_excel(press_office_data_fp)
-    #press_df.set_index('id', inplace=True)
-    # raw_df = website_df.join(press_df)
+    return raw_df, config
 
-    # if combined
-    raw_df = website_df
 
-    return raw_df, config
+def load_data_chunks(config, chunksize):
+    '''Modify this if you modify load_data!
+
+    Streaming version of load_data, used when stream_chunksize is set
+    in the config. Instead of loading all the data at once,
+    this yields it a chunk at a time, and each chunk is cleaned and
+    preprocessed before the next one is loaded.
+
+    Args:
+        config (dict): The configuration dictionary, loaded from a YAML file.
+        chunksize (int): Number of rows per chunk.
+
+    Yields:
+        raw_df (pandas.DataFrame): A chunk of the data.
+        config (dict): The configuration dictionary, loaded from a YAML file.
+    '''
+    if config.get('ingestion_mode', 'most_recent') != 'most_recent':
+        raise ValueError(
+            'Streaming the data is only available for ingestion_mode: most_recent.'
+        )
+
+    source_fps = get_source_fps(config)
+    reader = pd.read_csv(
+        source_fps['website'],
+        parse_dates=['Date',],
+        dtype=utils.get_parse_dtypes(config),
+        encoding_errors='ignore',
+        chunksize=chunksize,
+    )
+    with reader:
+        for website_df in reader:
+            website_df.set_index('id', inplace=True)
+            if config.get('include_press_office', False):
+                website_df = join_press_office_data(
+                    website_df,
+                    source_fps['press_office'],
+                    config,
+                )
+            yield website_df, config
 
 
 def clean_data(raw_df, config):
@@ -93,7 +250,8 @@ def clean_data(raw_df, config):
         config (dict): The (possibly altered) configuration dictionary.
     '''
 
-    raw_df['Date'] = pd.to_datetime(raw_df['Date'], errors='coerce')
+    # The export mixes date formats, e.g. 4/4/2025 and 8/27/25
+    raw_df['Date'] = pd.to_datetime(raw_df['Date'], errors='coerce', format='mixed')
 
     # Drop rows where 'Date' year is 1970
     cleaned_df = raw_df[raw_df['Date'].dt.year != 1970]
@@ -158,8 +316,6 @@ def preprocess_data(cleaned_df, config):
     # Tweaks to the press data
     if 'Title (optional)' in preprocessed_df.columns:
         preprocessed_df.drop('Title (optional)', axis='columns', inplace=True)
-    for column in ['Press Mentions', 'People Reached']:
-        preprocessed_df[column] = preprocessed_df[column].astype('Int64')
 
     # Now explode the data
     '''
@@ -173,13 +329,14 @@ def preprocess_data(cleaned_df, config):
     preprocessed_df['id'] = preprocessed_df.index
     preprocessed_df.set_index(np.arange(len(preprocessed_df)), inplace=True)
 
-    def legacy(date):
-        if date.year < 2014:
-            return "LEGACY"
-        else:
-            return "CURRENT"
-    
-    preprocessed_df['Legacy'] = preprocessed_df['Date'].apply(legacy)
+    preprocessed_df['Legacy'] = pd.Categorical(
+        np.where(preprocessed_df['Date'].dt.year < 2014, 'LEGACY', 'CURRENT'),
+        categories=['CURRENT', 'LEGACY'],
+    )
+
+    # Use the compact column types in the config,
+    # e.g. categories instead of strings.
+    preprocessed_df = utils.apply_schema(preprocessed_df, config)
 
 
     # This flag exists just to demonstrate you can modify the config
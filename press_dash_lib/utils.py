@@ -1,8 +1,186 @@
 '''Miscellaneous useful functions.
 '''
 
+import numpy as np
 import pandas as pd
 
+# The column classes in the config that can be assigned a dtype
+COLUMN_CLASSES = ['categorical_columns', 'numerical_columns', 'text_columns']
+
+
+def get_column_dtypes(config: dict) -> dict:
+    '''Get the dtype for each column, according to the dtype
+    the config assigns to that column's class (categorical, numerical, text).
+
+    Args:
+        config (dict): The config dictionary.
+
+    Returns:
+        column_dtypes (dict): The dtype for each column.
+    '''
+    class_dtypes = config.get('column_dtypes', {})
+    column_dtypes = {}
+    for column_class in COLUMN_CLASSES:
+        if column_class not in class_dtypes:
+            continue
+        for column in config.get(column_class, []):
+            column_dtypes[column] = class_dtypes[column_class]
+
+    return column_dtypes
+
+
+def get_parse_dtypes(config: dict) -> dict:
+    '''Get the dtypes that can be used when the data is first read.
+    Only text columns are read straight into their dtype.
+    Categorical columns usually have their values edited during cleaning,
+    and numerical columns usually have missing values until cleaned,
+    so both are converted after preprocessing instead.
+
+    Args:
+        config (dict): The config dictionary.
+
+    Returns:
+        parse_dtypes (dict): The dtype to read each column as.
+    '''
+    text_dtype = config.get('column_dtypes', {}).get('text_columns')
+    if text_dtype is None:
+        return {}
+
+    # Categorical columns are excluded even if they're also text columns,
+    # since categories built on string dtypes don't split into lists
+    categorical_columns = config.get('categorical_columns', [])
+    parse_dtypes = {
+        column: text_dtype
+        for column in config.get('text_columns', [])
+        if column not in categorical_columns
+    }
+
+    return parse_dtypes
+
+
+def compact_int(series: pd.Series) -> pd.Series:
+    '''Convert a series to the smallest integer type that can hold its values.
+    Series with missing values use the nullable equivalent, and series
+    with non-integer values are returned unchanged.
+
+    Args:
+        series (pd.Series): The series to convert.
+
+    Returns:
+        compacted (pd.Series): The converted series.
+    '''
+    values = series.dropna()
+    if len(values) == 0:
+        return series
+    try:
+        values = values.to_numpy(dtype=float)
+    except (TypeError, ValueError):
+        return series
+    if not np.all(np.mod(values, 1) == 0):
+        return series
+
+    dtype = np.result_type(
+        np.min_scalar_type(int(values.min())),
+        np.min_scalar_type(int(values.max())),
+    )
+    if len(values) < len(series):
+        # Nullable dtypes are named like the numpy ones, but capitalized
+        return series.astype(dtype.name.capitalize().replace('Uint', 'UInt'))
+
+    return series.astype(dtype)
+
+
+def apply_schema(df: pd.DataFrame, config: dict, column_dtypes: dict = None) -> pd.DataFrame:
+    '''Convert the columns of a dataframe to the dtypes in the config.
+    The dtype 'compact_int' uses the smallest integer type that fits the data.
+    Columns not in the dataframe are skipped.
+
+    Args:
+        df (pd.DataFrame): The dataframe to convert. Modified in place.
+        config (dict): The config dictionary.
+        column_dtypes (dict): The dtype for each column, e.g. from get_parse_dtypes
+            for data that isn't preprocessed. Defaults to get_column_dtypes.
+
+    Returns:
+        df (pd.DataFrame): The converted dataframe.
+    '''
+    if column_dtypes is None:
+        column_dtypes = get_column_dtypes(config)
+    for column, dtype in column_dtypes.items():
+        if column not in df.columns:
+            continue
+        if dtype == 'compact_int':
+            df[column] = compact_int(df[column])
+        else:
+            df[column] = df[column].astype(dtype)
+
+    return df
+
+
+def stringify_mixed_columns(df: pd.DataFrame) -> pd.DataFrame:
+    '''Convert object columns with mixed types (e.g. strings and floats) to strings.
+    Columnar formats require one type per column, so the data is converted
+    the same way whether it's freshly built or loaded from disk.
+
+    Args:
+        df (pd.DataFrame): The dataframe to convert.
+
+    Returns:
+        df (pd.DataFrame): The converted dataframe. The original is not modified.
+    '''
+    mixed_columns = [
+        column for column in df.columns
+        if (
+            df[column].dtype == object
+            and pd.api.types.infer_dtype(df[column], skipna=True).startswith('mixed')
+        )
+    ]
+    if len(mixed_columns) == 0:
+        return df
+
+    df = df.copy()
+    for column in mixed_columns:
+        is_null = df[column].isna()
+        df[column] = df[column].astype(str).mask(is_null)
+
+    return df
+
+
+def get_fiscal_periods(dates, start_months=range(1, 13), start_day: int = 1):
+    '''Get the fiscal year and fiscal month of dates, for one or more
+    months the year could start on. Computed with integer arithmetic on the
+    datetime64 month counts, so the whole column is done in one pass
+    for all the start months.
+
+    Args:
+        dates (array-like of datetime64): The dates.
+        start_months (list of int): The months the year starts on, 1-12.
+        start_day (int): The day of the month the year starts on.
+            Dates before this day count towards the previous fiscal month.
+
+    Returns:
+        fiscal_years (np.ndarray of int16): Shape (len(start_months), len(dates)).
+            The calendar year each fiscal year starts in. 0 for missing dates.
+        fiscal_months (np.ndarray of int8): Shape (len(start_months), len(dates)).
+            The month counted from 1 at the start month. 0 for missing dates.
+    '''
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    is_missing = np.isnat(dates)
+    months_since_epoch = dates.astype('datetime64[M]').astype(np.int64)
+    if start_day != 1:
+        days = (dates - dates.astype('datetime64[M]')).astype(np.int64) + 1
+        months_since_epoch -= days < start_day
+
+    # Shifting by the start month makes every fiscal year start on a multiple of 12
+    start_months = np.asarray(start_months, dtype=np.int64)[:, np.newaxis]
+    shifted = months_since_epoch - (start_months - 1)
+    fiscal_years = (shifted // 12 + 1970).astype(np.int16)
+    fiscal_months = (shifted % 12 + 1).astype(np.int8)
+    fiscal_years[:, is_missing] = 0
+    fiscal_months[:, is_missing] = 0
+
+    return fiscal_years, fiscal_months
+
 
 def get_year(date, start_of_year='January 1', years_min=None, years_max=None, default_date_start=None, default_date_end=None):
     '''Get the year from a date, with a user-specified start date
@@ -10,37 +188,33 @@ def get_year(date, start_of_year='January 1', years_min=None, years_max=None, de
     This is commonly used for loading data, so it's kept in the user utils.
 
     Args:
-        date (datetime.datetime): The date to get the year from.
+        date (pd.Series of datetime): The dates to get the year from.
         start_of_year (str): The start of the year, e.g. 'January 1'.
-        years_min (int): The minimum year to include. Defaults to the minimum year in the data.
-        years_max (int): The maximum year to include. Defaults to the maximum year in the data.
+        years_min (int): The minimum year to include. Defaults to no minimum.
+        years_max (int): The maximum year to include. Defaults to no maximum.
+        default_date_start (int): The minimum year used if years_min isn't a valid year.
+        default_date_end (int): The maximum year used if years_max isn't a valid year.
 
     Returns:
-        years (pd.Series of int): The year of the date.
+        years (pd.Series of Int64): The year of the date.
+            Missing for missing dates and years outside the range.
     '''
-
-    # Get date bins
-    if years_min is None:
-        years_min = date.min().year - 1
-    if years_max is None:
-        years_max = date.max().year + 1
     try:
-        years_min = int(years_min)
-        years_max = int(years_max)
-    except:
+        years_min = None if years_min is None else int(years_min)
+        years_max = None if years_max is None else int(years_max)
+    except (TypeError, ValueError):
         years_min = default_date_start
         years_max = default_date_end
 
-    date_bins = pd.date_range(
-        '{} {}'.format(start_of_year, years_min),
-        pd.Timestamp.now() + pd.offsets.DateOffset(years=1),
-        freq = pd.offsets.DateOffset(years=1),
-        inclusive="left",
-    )
-    
-    date_bin_labels = date_bins.year[:-1]
-    #print(date_bin_labels)
-    # The actual binning
-    years = pd.cut(date, date_bins, right=False, labels=date_bin_labels).astype('Int64')
+    # Any year will do, since only the month and day are used
+    start = pd.Timestamp('{} 2000'.format(start_of_year))
+    fiscal_years, _ = get_fiscal_periods(date, [start.month,], start.day)
+    years = pd.Series(fiscal_years[0], index=date.index, dtype='Int64')
+
+    is_excluded = years == 0
+    if years_min is not None:
+        is_excluded |= years < years_min
+    if years_max is not None:
+        is_excluded |= years > years_max
 
-    return years
+    return years.mask(is_excluded)
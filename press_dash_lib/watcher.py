@@ -0,0 +1,121 @@
+'''Module for watching the raw data and rebuilding the dashboard data
+in the background when it changes.
+'''
+import os
+import threading
+import time
+import traceback
+
+
+class RawDataWatcher:
+    '''Class that polls a directory and, when its contents change,
+    rebuilds the data in a background thread. The previous data keeps
+    being served until the rebuild finishes, and is then swapped out
+    all at once.
+
+    Polling is used instead of filesystem events so that the watcher
+    works the same on every platform without extra dependencies.
+
+    Args:
+        watch_dir: The directory to watch.
+        rebuild_fn: Function with no arguments that returns the rebuilt data.
+        interval: Seconds between checks of the directory.
+    '''
+
+    def __init__(self, watch_dir: str, rebuild_fn, interval: float = 10.):
+        self.watch_dir = watch_dir
+        self.rebuild_fn = rebuild_fn
+        self.interval = interval
+
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.state = None
+        self.pending_state = None
+        self.version = 0
+        self.result = None
+
+    def get_state(self) -> tuple:
+        '''Get a summary of the directory contents that changes whenever
+        a file is added, removed, or modified. Only file metadata is read.
+
+        Returns:
+            state: Sorted (filename, size, mtime) for each file.
+        '''
+        state = []
+        with os.scandir(self.watch_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                state.append((entry.name, stat.st_size, stat.st_mtime_ns))
+
+        return tuple(sorted(state))
+
+    def rebuild(self, state: tuple):
+        '''Rebuild the data and swap it in.
+        If the rebuild fails the previous data is kept.
+
+        Args:
+            state: The directory state the rebuild corresponds to.
+        '''
+        try:
+            result = self.rebuild_fn()
+        except Exception:
+            print('Rebuilding the data failed, keeping the previous version:')
+            traceback.print_exc()
+        else:
+            with self.lock:
+                self.result = result
+                self.version += 1
+        # Failures are also recorded, so we don't retry until the files change again
+        self.state = state
+
+    def start(self):
+        '''Build the data, then start watching for changes in the background.
+        The first build happens immediately, so there's always data to serve.
+        '''
+        # Unlike later rebuilds, errors here are raised,
+        # since there's no previous data to fall back on
+        self.state = self.get_state()
+        self.result = self.rebuild_fn()
+        self.version = 1
+        self.thread = threading.Thread(target=self.watch, daemon=True)
+        self.thread.start()
+
+    def watch(self):
+        '''Check the directory every interval until stopped.
+        A change is only acted on once the directory stops changing
+        for one interval, so files that are still being written
+        aren't loaded.
+        '''
+        while not self.stop_event.wait(self.interval):
+            state = self.get_state()
+            if state == self.state:
+                self.pending_state = None
+            elif state == self.pending_state:
+                msg = 'Change in {} detected, rebuilding data...'.format(self.watch_dir)
+                print(msg)
+                start = time.time()
+                self.rebuild(state)
+                print('Rebuilt data in {:.2g} seconds.'.format(time.time() - start))
+                self.pending_state = None
+            else:
+                self.pending_state = state
+
+    def stop(self):
+        '''Stop watching the directory.'''
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def current(self):
+        '''Get the current version of the data.
+
+        Returns:
+            version: Number incremented each time the data is rebuilt.
+            result: The data returned by the most-recent rebuild.
+        '''
+        with self.lock:
+            return self.version, self.result
@@ -18,6 +18,11 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/CIERA-Northwestern/press-dash",
     packages=setuptools.find_packages(),
+    entry_points={
+        'console_scripts': [
+            'press-dash-prewarm=press_dash_lib.prewarm:main',
+        ],
+    },
     install_requires = [
         'numpy',
         'pandas',
@@ -28,6 +33,7 @@ setuptools.setup(
         'nbformat',
         'PyYAML',
         'streamlit',
+        'pyarrow',
         'pytest',
         'jupyterlab',
 	'root-dash',